@@ -0,0 +1,149 @@
+import os
+import sys
+import tempfile
+import argparse
+import threading
+import contextvars
+from typing import Optional
+
+from pg_queries import local_date_range_sql
+from pg_tools import get_conn, release_conn, user_scope, _apply_user_scope
+
+
+def _export_sql(cur, user_id: str, date_from_local: str, date_to_local: str) -> str:
+    # COPY não aceita parâmetros: o SELECT é montado com mogrify (escapado pelo driver)
+    select = cur.mogrify(
+        f"""
+        SELECT
+            t.id,
+            (t.occurred_at AT TIME ZONE 'America/Sao_Paulo') AS occurred_at_local,
+            t.amount::numeric(18, 2) AS amount,
+            tt.type AS type_name,
+            c.name AS category_name,
+            t.description,
+            t.payment_method,
+            t.source_text
+        FROM transactions t
+        JOIN transaction_types tt ON tt.id = t.type
+        LEFT JOIN categories c ON c.id = t.category_id
+        WHERE t.user_id = %s
+          AND {local_date_range_sql("t.occurred_at")}
+        ORDER BY t.occurred_at
+        """,
+        (user_id, date_from_local, date_to_local),
+    ).decode()
+    return f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+
+def export_csv(out, date_from_local: str, date_to_local: str) -> None:
+    """Escreve em `out` (arquivo binário) o CSV das transações do usuário atual no intervalo local."""
+    conn = get_conn(readonly=True)
+    cur = conn.cursor()
+    try:
+        user_id = _apply_user_scope(cur)
+        cur.copy_expert(_export_sql(cur, user_id, date_from_local, date_to_local), out)
+    finally:
+        try:
+            cur.close()
+            release_conn(conn)
+        except Exception:
+            pass
+
+
+def export_parquet(path: str, date_from_local: str, date_to_local: str, block_size: int = 32 << 20) -> int:
+    """
+    Grava em Parquet as transações do usuário atual no intervalo local. O COPY escreve
+    num pipe lido em blocos de `block_size` bytes pelo leitor CSV do pyarrow; cada bloco
+    vira um row group, então a memória fica limitada a poucos blocos. O arquivo é escrito
+    ao lado de `path` com nome temporário e só substitui `path` se a exportação terminar;
+    em caso de erro nada fica no lugar. Retorna o nº de linhas.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Exportar em Parquet requer o pacote pyarrow (pip install pyarrow).") from e
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        with os.fdopen(write_fd, "wb") as w:
+            try:
+                export_csv(w, date_from_local, date_to_local)
+            except Exception as e:
+                errors.append(e)
+
+    # copy_context: a thread do COPY precisa enxergar o usuário de user_scope
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="export-copy", daemon=True)
+    producer.start()
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("occurred_at_local", pa.timestamp("us")),
+        ("amount", pa.decimal128(18, 2)),  # o SELECT já arredonda para numeric(18, 2)
+        ("type_name", pa.string()),
+        ("category_name", pa.string()),
+        ("description", pa.string()),
+        ("payment_method", pa.string()),
+        ("source_text", pa.string()),
+    ])
+    rows = 0
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".parquet.tmp")
+    os.close(tmp_fd)
+    try:
+        with os.fdopen(read_fd, "rb") as r:
+            try:
+                reader = pacsv.open_csv(
+                    r,
+                    read_options=pacsv.ReadOptions(block_size=block_size),
+                    convert_options=pacsv.ConvertOptions(
+                        column_types=schema,
+                        strings_can_be_null=True,
+                        quoted_strings_can_be_null=False,
+                    ),
+                )
+                with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+                        rows += batch.num_rows
+            except Exception:
+                if errors:
+                    raise errors[0]
+                raise
+        producer.join()
+        if errors:
+            raise errors[0]
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return rows
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Exporta o extrato de transações (CSV ou Parquet) via COPY.")
+    parser.add_argument("--from", dest="date_from", required=True, help="Data local inicial (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="date_to", required=True, help="Data local final (YYYY-MM-DD).")
+    parser.add_argument("--user", default=None, help="user_id (padrão: DEFAULT_USER_ID).")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output", "-o", default="-", help="Arquivo de saída ('-' = stdout, só CSV).")
+    args = parser.parse_args(argv)
+
+    with user_scope(args.user):
+        if args.format == "csv":
+            if args.output == "-":
+                export_csv(sys.stdout.buffer, args.date_from, args.date_to)
+            else:
+                with open(args.output, "wb") as out:
+                    export_csv(out, args.date_from, args.date_to)
+        else:
+            if args.output == "-":
+                parser.error("Parquet precisa de --output com um caminho de arquivo.")
+            rows = export_parquet(args.output, args.date_from, args.date_to)
+            print(f"{rows} transações exportadas para {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
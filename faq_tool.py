@@ -1,7 +1,14 @@
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 
@@ -9,18 +16,291 @@ load_dotenv()
 
 pdf_path = "FAQ_assessor_v1.1.pdf"
 
-def get_faq_context(question: str) -> str:
-    loader = PyPDFLoader(pdf_path)
-    docs = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=150)
-    chunks = text_splitter.split_documents(docs)
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/gemini-embedding-001",
-        google_api_key=os.getenv("GEMINI_API_KEY"),
-        transport='rest'
-    )   
-
-    db = FAISS.from_documents(chunks, embeddings)
-    results = db.similarity_search(question, k=6)
+_lock = threading.Lock()
+# Lock próprio: _get_faq_index chama get_embeddings() segurando _lock
+_embeddings_lock = threading.Lock()
+_embeddings = None
+_index = None
+_index_version = None
+_pdf_stat = None
+_pdf_hash = None
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embedder local em CPU (sentence-transformers), carregado do disco.
+    Não faz chamadas de rede; documentos são codificados em lotes.
+    backend="onnx" usa o runtime ONNX do sentence-transformers (>= 3.2).
+    """
+
+    def __init__(self, model_path: str, backend: str = "torch", batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "FAQ_EMBEDDINGS_PROVIDER=local requer o pacote sentence-transformers "
+                "(pip install sentence-transformers; para ONNX: sentence-transformers[onnx])."
+            ) from e
+        kwargs = {"device": "cpu", "local_files_only": True}
+        if backend != "torch":
+            kwargs["backend"] = backend
+        self.model = SentenceTransformer(model_path, **kwargs)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _embeddings_config() -> tuple:
+    provider = os.getenv("FAQ_EMBEDDINGS_PROVIDER", "gemini").strip().lower()
+    if provider == "local":
+        # FAQ e perguntas em português: o modelo padrão precisa ser multilíngue
+        return provider, os.getenv("FAQ_EMBEDDINGS_MODEL_PATH", "models/paraphrase-multilingual-MiniLM-L12-v2")
+    if provider == "gemini":
+        return provider, os.getenv("FAQ_EMBEDDINGS_MODEL", "models/gemini-embedding-001")
+    raise ValueError(f"FAQ_EMBEDDINGS_PROVIDER inválido: '{provider}' (use gemini | local).")
+
+
+def get_embeddings() -> Embeddings:
+    """Retorna o provedor de embeddings configurado em FAQ_EMBEDDINGS_PROVIDER (gemini | local)."""
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            provider, model = _embeddings_config()
+            if provider == "local":
+                _embeddings = LocalEmbeddings(
+                    model,
+                    backend=os.getenv("FAQ_EMBEDDINGS_BACKEND", "torch"),
+                    batch_size=int(os.getenv("FAQ_EMBEDDINGS_BATCH_SIZE", "64")),
+                )
+            else:
+                _embeddings = GoogleGenerativeAIEmbeddings(
+                    model=model,
+                    google_api_key=os.getenv("GEMINI_API_KEY"),
+                    transport='rest'
+                )
+        return _embeddings
+
+
+def faq_index_version() -> str:
+    """
+    Versão do índice do FAQ: provedor/modelo de embeddings + hash SHA-256 do PDF.
+    O hash só é recalculado quando mtime/tamanho do arquivo mudam.
+    """
+    global _pdf_stat, _pdf_hash
+    st = os.stat(pdf_path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    if stat_key != _pdf_stat:
+        with open(pdf_path, "rb") as f:
+            _pdf_hash = hashlib.sha256(f.read()).hexdigest()
+        _pdf_stat = stat_key
+    provider, model = _embeddings_config()
+    return f"{provider}:{model}:{_pdf_hash}"
+
+
+def _get_faq_index():
+    """Carrega o PDF e monta o índice FAISS uma vez por versão do documento."""
+    global _index, _index_version
+    version = faq_index_version()
+    with _lock:
+        if _index is None or _index_version != version:
+            loader = PyPDFLoader(pdf_path)
+            docs = loader.load()
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=150)
+            chunks = text_splitter.split_documents(docs)
+            _index = FAISS.from_documents(chunks, get_embeddings())
+            _index_version = version
+        return _index
+
+
+def embed_question(question: str) -> List[float]:
+    return get_embeddings().embed_query(question)
+
+
+def get_faq_context(question: str, embedding: Optional[List[float]] = None) -> str:
+    db = _get_faq_index()
+    if embedding is None:
+        embedding = embed_question(question)
+    results = db.similarity_search_by_vector(embedding, k=6)
     context = "\n".join([doc.page_content for doc in results])
-    return context
\ No newline at end of file
+    return context
+
+
+class FaqAnswerCache:
+    """
+    Cache de respostas do FAQ indexado pelo embedding da pergunta.
+
+    Uma pergunta nova reaproveita a resposta de uma pergunta anterior quando a
+    similaridade de cosseno entre os embeddings é >= threshold e a versão do
+    índice (PDF) é a mesma. Tamanho limitado com despejo LRU; ao mudar a versão
+    do índice todas as entradas são descartadas.
+    """
+
+    def __init__(self, max_size: int = 256, threshold: float = 0.92):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.version = None
+        self._entries = OrderedDict()  # chave -> (vetor normalizado, resposta, pergunta)
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def lookup(self, embedding, version: str) -> Optional[str]:
+        vec = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            scores = matrix @ vec
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def store(self, embedding, answer: str, version: str, question: Optional[str] = None) -> None:
+        vec = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_key] = (vec, answer, question)
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "version": self.version,
+            }
+
+
+# Corte padrão do cache por provedor: cada modelo distribui os scores de cosseno numa faixa
+# diferente. Valores conservadores (um falso acerto devolve a política errada com confiança);
+# recalibre com `python faq_tool.py` ao trocar de modelo. FAQ_CACHE_THRESHOLD sobrepõe.
+CACHE_THRESHOLDS = {"gemini": 0.95, "local": 0.92}
+
+
+def cache_threshold() -> float:
+    value = os.getenv("FAQ_CACHE_THRESHOLD")
+    if value:
+        return float(value)
+    provider = os.getenv("FAQ_EMBEDDINGS_PROVIDER", "gemini").strip().lower()
+    return CACHE_THRESHOLDS.get(provider, max(CACHE_THRESHOLDS.values()))
+
+
+faq_answer_cache = FaqAnswerCache(
+    max_size=int(os.getenv("FAQ_CACHE_MAX_SIZE", "256")),
+    threshold=cache_threshold(),
+)
+
+
+if __name__ == "__main__":
+    # Calibração do corte do cache para o provedor de FAQ_EMBEDDINGS_PROVIDER: paráfrases
+    # devem ficar acima do corte (reaproveitam a resposta) e perguntas parecidas sobre outra
+    # regra devem ficar abaixo. Sai com código 1 se algum par negativo acertaria o cache.
+    # Mede também a latência do embedding de uma pergunta (caminho de cada chamada ao FAQ).
+    import sys
+    import time
+
+    PARAFRASES = [
+        ("posso excluir lançamento?", "dá pra apagar uma transação?"),
+        ("como cadastro um gasto?", "como faço para registrar uma despesa?"),
+        ("meus dados ficam salvos com segurança?", "as minhas informações estão protegidas?"),
+        ("dá para exportar o extrato?", "consigo baixar meu extrato?"),
+        ("o assessor marca compromissos na agenda?", "posso agendar um compromisso pelo assessor?"),
+    ]
+    QUASE_IGUAIS = [
+        ("posso excluir lançamento?", "posso editar lançamento?"),
+        ("como cadastro um gasto?", "como cadastro uma receita?"),
+        ("dá para exportar o extrato?", "dá para importar o extrato?"),
+        ("posso apagar um compromisso?", "posso apagar uma transação?"),
+        ("qual o limite de transações por dia?", "qual o limite de compromissos por dia?"),
+    ]
+
+    provider, model = _embeddings_config()
+    threshold = faq_answer_cache.threshold
+    embeddings = get_embeddings()
+
+    def similarity(a: str, b: str) -> float:
+        va, vb = (FaqAnswerCache._normalize(v) for v in embeddings.embed_documents([a, b]))
+        return float(va @ vb)
+
+    print(f"{provider}:{model}  corte atual {threshold:.3f}")
+    positives = []
+    for a, b in PARAFRASES:
+        positives.append(similarity(a, b))
+        print(f"  + {positives[-1]:.3f}  {a} | {b}")
+    negatives = []
+    for a, b in QUASE_IGUAIS:
+        negatives.append(similarity(a, b))
+        print(f"  - {negatives[-1]:.3f}  {a} | {b}")
+
+    lowest_positive, highest_negative = min(positives), max(negatives)
+    print(f"paráfrases: mín {lowest_positive:.3f}   quase iguais: máx {highest_negative:.3f}")
+    if lowest_positive > highest_negative:
+        print(f"corte sugerido: {(lowest_positive + highest_negative) / 2:.3f}")
+    else:
+        print("faixas se sobrepõem: nenhum corte separa os pares; mantenha o cache conservador")
+    false_hits = sum(score >= threshold for score in negatives)
+    missed = sum(score < threshold for score in positives)
+    print(f"com o corte atual: {false_hits} falsos acertos, {missed} paráfrases sem acerto")
+
+    questions = [q for pair in PARAFRASES + QUASE_IGUAIS for q in pair]
+    timings = []
+    for question in questions * 4:
+        start = time.perf_counter()
+        embed_question(question)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"embedding da pergunta: mediana {timings[len(timings) // 2]:.2f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms ({len(timings)} chamadas)"
+    )
+    sys.exit(1 if false_hits else 0)
@@ -0,0 +1,235 @@
+import os
+import copy
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("ResourceExhausted", "RateLimit", "ServiceUnavailable", "DeadlineExceeded", "Timeout")
+# Mensagem do Gemini para cota esgotada quando o erro chega embrulhado (ex.: ChatGoogleGenerativeAIError)
+RETRYABLE_MESSAGES = ("Resource has been exhausted",)
+
+
+def is_retryable(e: Exception) -> bool:
+    """Erros transitórios do provedor (limite de taxa, indisponibilidade, timeout)."""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(e, attr, None)
+        if isinstance(value, int) and value in RETRYABLE_STATUS:
+            return True
+    name = type(e).__name__
+    return any(n in name for n in RETRYABLE_NAMES) or any(m in str(e) for m in RETRYABLE_MESSAGES)
+
+
+class TokenBucket:
+    """Limite de taxa: até `capacity` chamadas em rajada, reabastecendo `rate` por segundo."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Bloqueia até haver um token; retorna o tempo esperado em segundos."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class Coalescer:
+    """
+    Junta chamadas idênticas em andamento: só a primeira executa, as demais recebem uma
+    cópia do resultado (cada chamador pode alterar o seu sem afetar os outros).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, fn: Callable[[], Any]):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return copy.deepcopy(future.result()), True
+        try:
+            result = fn()
+            # Os seguidores copiam de um snapshot que o líder não altera depois (ex.: message.id)
+            future.set_result(copy.deepcopy(result))
+            return result, False
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class GuardedChatModel(BaseChatModel):
+    """
+    Envolve um chat model com:
+      - semáforo de concorrência (max_concurrency chamadas simultâneas ao provedor);
+      - token bucket (rate_per_s, rajada de burst);
+      - novas tentativas com backoff exponencial e jitter para erros transitórios (429/5xx);
+      - coalescência de prompts idênticos em andamento numa única chamada.
+    bind_tools é repassado ao modelo interno, então agentes com tools também passam pelo guard.
+    """
+
+    inner: BaseChatModel
+    max_concurrency: int = 4
+    rate_per_s: float = 5.0
+    burst: int = 5
+    max_retries: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    coalesce: bool = True
+
+    _semaphore: threading.BoundedSemaphore = PrivateAttr()
+    _bucket: TokenBucket = PrivateAttr()
+    _coalescer: Coalescer = PrivateAttr()
+    _stats: Dict[str, float] = PrivateAttr()
+    _stats_lock: threading.Lock = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._bucket = TokenBucket(self.rate_per_s, self.burst)
+        self._coalescer = Coalescer()
+        self._stats = {"calls": 0, "provider_calls": 0, "coalesced": 0, "retries": 0, "failures": 0, "throttled_s": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return f"guarded-{self.inner._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        bound = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    @staticmethod
+    def _prompt_key(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        payload = json.dumps(
+            {
+                "messages": [m.model_dump(exclude={"id"}) for m in messages],
+                "stop": stop,
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _call_with_retry(self, fn: Callable[[], ChatResult]) -> ChatResult:
+        attempt = 0
+        while True:
+            self._count("throttled_s", self._bucket.acquire())
+            try:
+                with self._semaphore:
+                    self._count("provider_calls")
+                    return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                # backoff exponencial com "full jitter"
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))))
+                attempt += 1
+                self._count("retries")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._count("calls")
+        call = lambda: self._call_with_retry(lambda: self.inner._generate(messages, stop=stop, **kwargs))
+        if not self.coalesce:
+            return call()
+        result, coalesced = self._coalescer.run(self._prompt_key(messages, stop, kwargs), call)
+        if coalesced:
+            self._count("coalesced")
+        return result
+
+
+def guarded(model: BaseChatModel, name: str) -> GuardedChatModel:
+    """Aplica o guard com limites de LLM_<NAME>_* (ex.: LLM_FAST_MAX_CONCURRENCY) ou os padrões."""
+    prefix = f"LLM_{name.upper()}_"
+    return GuardedChatModel(
+        inner=model,
+        max_concurrency=int(os.getenv(prefix + "MAX_CONCURRENCY", "4")),
+        rate_per_s=float(os.getenv(prefix + "RATE_PER_S", "5")),
+        burst=int(os.getenv(prefix + "BURST", "5")),
+        max_retries=int(os.getenv(prefix + "MAX_RETRIES", "5")),
+        coalesce=os.getenv(prefix + "COALESCE", "1") == "1",
+    )
+
+
+if __name__ == "__main__":
+    # Demonstração com o modelo falso: 50 chamadas concorrentes, metade com o mesmo prompt.
+    from concurrent.futures import ThreadPoolExecutor
+
+    class RateLimitError(Exception):
+        status_code = 429
+
+    class FakeFlakyChatModel(BaseChatModel):
+        """Modelo local para testes: responde após `latency_s` e falha com 429 em `error_rate` das chamadas."""
+
+        response: str = "ok"
+        latency_s: float = 0.05
+        error_rate: float = 0.2
+        calls: int = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-flaky"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            self.calls += 1
+            time.sleep(self.latency_s)
+            if random.random() < self.error_rate:
+                raise RateLimitError("429 Resource has been exhausted (fake)")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    fake = FakeFlakyChatModel(latency_s=0.2, error_rate=0.3)
+    model = GuardedChatModel(inner=fake, max_concurrency=4, rate_per_s=20, burst=5, base_delay=0.05, max_delay=1)
+    prompts = ["posso excluir lançamento?"] * 25 + [f"pergunta {i}" for i in range(25)]
+
+    def ask(p):
+        try:
+            return model.invoke(p).content
+        except Exception as e:
+            return f"erro: {e}"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(50) as pool:
+        answers = list(pool.map(ask, prompts))
+    elapsed = time.perf_counter() - start
+    print(f"{len(prompts)} chamadas em {elapsed:.2f}s, erros={sum(a.startswith('erro') for a in answers)}")
+    print(f"chamadas ao modelo falso: {fake.calls}")
+    print(model.stats())
@@ -0,0 +1,373 @@
+"""
+Gerador de carga / soak test do Assessor.AI.
+
+Simula N sessões concorrentes misturando lançamentos, consultas, saldos,
+atualizações e perguntas de FAQ, contra um Postgres local (schema + migrations
+aplicados, .env apontando para ele) e modelos stub (sem chamadas ao Gemini).
+
+    python loadtest.py --sessions 50 --users 10 --duration 600 --mode mixed
+
+--mode agent   : cada operação passa por fluxo_assessor (roteador -> especialista -> orquestrador)
+--mode direct  : chama as tools de pg_tools diretamente
+--mode mixed   : sorteia entre os dois por operação
+
+Relata periodicamente throughput, latência (p50/p95/p99), taxa de erros, conexões
+no banco, memória do processo e crescimento do `store` de históricos.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from array import array
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+
+# Limites altos para o guard dos LLMs não ser o gargalo (o ambiente pode sobrescrever)
+for _name in ("MAIN", "FAST"):
+    os.environ.setdefault(f"LLM_{_name}_MAX_CONCURRENCY", "256")
+    os.environ.setdefault(f"LLM_{_name}_RATE_PER_S", "100000")
+    os.environ.setdefault(f"LLM_{_name}_BURST", "100000")
+    os.environ.setdefault(f"LLM_{_name}_COALESCE", "0")
+os.environ.setdefault("GEMINI_API_KEY", "loadtest-stub")
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tracers.context import register_configure_hook
+
+import faq_tool
+faq_tool._embeddings = DeterministicFakeEmbedding(size=256)
+
+import main
+import pg_tools
+from route_decision import FALLBACK_REPLY
+from zoneinfo import ZoneInfo
+
+
+TZ = ZoneInfo("America/Sao_Paulo")
+
+MIX = {"insert": 35, "query": 20, "balance": 20, "update": 10, "faq": 15}
+
+MENSAGENS = {
+    "insert": [
+        "Registrar almoço hoje R$ {v} no débito",
+        "Registrar mercado hoje R$ {v} no crédito",
+        "Registrar uber hoje R$ {v} no pix",
+    ],
+    "query": [
+        "Quais foram meus gastos de hoje?",
+        "Mostre minhas últimas transações",
+    ],
+    "balance": [
+        "Qual meu saldo de hoje?",
+        "Qual meu saldo total?",
+    ],
+    "update": [
+        "Corrija o valor do almoço de hoje para R$ {v}",
+    ],
+    "faq": [
+        "posso excluir lançamento?",
+        "dá pra apagar uma transação?",
+        "meus dados são protegidos pela LGPD?",
+        "como falo com o suporte?",
+    ],
+}
+
+
+def classify(text: str) -> str:
+    if text.startswith("Registrar"):
+        return "insert"
+    if text.startswith("Corrija"):
+        return "update"
+    if "saldo" in text:
+        return "balance"
+    if text.startswith(("Quais", "Mostre")):
+        return "query"
+    return "faq"
+
+
+def tool_call_for(kind: str, text: str):
+    """Tool e argumentos que o especialista financeiro usaria para a mensagem."""
+    today = datetime.now(TZ).date().isoformat()
+    m = re.search(r"R\$ ([\d.]+)", text)
+    amount = float(m.group(1)) if m else 10.0
+    if kind == "insert":
+        return "add_transaction", {
+            "amount": amount, "source_text": text, "type_name": "EXPENSES",
+            "description": text.split()[1], "payment_method": text.split()[-1],
+        }
+    if kind == "query":
+        if text.startswith("Quais"):
+            return "query_transactions", {"date_local": today, "limit": 20}
+        return "query_transactions", {"limit": 20}
+    if kind == "balance":
+        if "total" in text:
+            return "total_balance", {}
+        return "daily_balance", {"date_local": today}
+    return "update_transaction", {"match_text": "almoço", "date_local": today, "amount": amount}
+
+
+class StubChatModel(BaseChatModel):
+    """Modelo stub: reconhece o papel pelo prompt e responde no formato esperado, com latência simulada."""
+
+    latency_s: float = 0.3
+
+    @property
+    def _llm_type(self) -> str:
+        return "loadtest-stub"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[getattr(t, "name", getattr(t, "__name__", str(t))) for t in tools])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            time.sleep(max(0.0, random.gauss(self.latency_s, self.latency_s * 0.3)))
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs.get("tools") or []))])
+
+    def _respond(self, messages, tools) -> AIMessage:
+        system = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        humans = [m for m in messages if isinstance(m, HumanMessage)]
+        last_human = humans[-1].content if humans else ""
+
+        # As tools do roteador estruturado foram vinculadas no import, pelo modelo real (dicts no
+        # formato do provedor), então o modo é detectado pelo prompt ou pelo nome dentro delas.
+        structured = "DECISÃO DE ROTA" in system or "RouteDecision" in repr(tools)
+        if "PROTOCOLO DE ENCAMINHAMENTO" in system or structured:
+            route = "faq" if classify(last_human) == "faq" else "financeiro"
+            if structured:
+                args = {"route": route, "pergunta_original": last_human, "clarify": ""}
+                return AIMessage(content="", tool_calls=[{"name": "RouteDecision", "args": args, "id": f"call_{random.getrandbits(32):x}"}])
+            return AIMessage(content=f"ROUTE={route}\nPERGUNTA_ORIGINAL={last_human}\nCLARIFY=")
+        if "CONTEXTO (trechos do documento)" in last_human:
+            return AIMessage(content="Segundo o FAQ, lançamentos não podem ser excluídos, apenas corrigidos.")
+        if "Agente Orquestrador" in system:
+            return AIMessage(content="Pronto, feito.\n- Recomendação:\nQuer ver o resumo do dia?")
+
+        # especialista financeiro: primeiro pede a tool, depois devolve o JSON
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content='{"dominio":"financeiro","intencao":"consultar","resposta":"Feito.","recomendacao":""}')
+        original = last_human.split("PERGUNTA_ORIGINAL=")[-1].split("\n")[0]
+        name, args = tool_call_for(classify(original), original)
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{random.getrandbits(32):x}"}])
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(lambda: array("d"))
+        self.window = array("d")
+        self.ops = defaultdict(int)
+        self.exceptions = defaultdict(int)
+        self.app_errors = defaultdict(int)
+
+    def record(self, kind: str, seconds: float, exception: bool = False, app_error: bool = False) -> None:
+        with self.lock:
+            self.ops[kind] += 1
+            self.latencies[kind].append(seconds)
+            self.window.append(seconds)
+            if exception:
+                self.exceptions[kind] += 1
+            if app_error:
+                self.app_errors[kind] += 1
+
+    def take_window(self) -> array:
+        with self.lock:
+            window, self.window = self.window, array("d")
+        return window
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def store_size() -> tuple:
+    histories = list(main.store.values())
+    return len(histories), sum(len(h.messages) for h in histories)
+
+
+def db_connections() -> int:
+    conn = pg_tools.get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database();")
+        return cur.fetchone()[0]
+    finally:
+        pg_tools.release_conn(conn)
+
+
+def pool_in_use() -> int:
+    return sum(len(pool._used) for pool, _ in list(pg_tools._pools.values()))
+
+
+class ToolErrors(BaseCallbackHandler):
+    """Conta as tools que devolveram {"status": "error"} dentro de uma operação via fluxo_assessor."""
+
+    def __init__(self):
+        self.errors = 0
+
+    def on_tool_end(self, output, **kwargs) -> None:
+        if isinstance(output, ToolMessage):
+            output = output.content
+        if isinstance(output, str):
+            try:
+                output = json.loads(output)
+            except ValueError:
+                return
+        if isinstance(output, dict) and output.get("status") == "error":
+            self.errors += 1
+
+
+# Handler da operação em andamento; o hook o inclui em todos os runs do contexto (roteador,
+# agentes, tools), inclusive nas threads do modo especulativo, que copiam o contexto
+_tool_errors: ContextVar = ContextVar("loadtest_tool_errors", default=None)
+register_configure_hook(_tool_errors, inheritable=True)
+
+
+def run_operation(kind: str, session_id: str, user_id: str, mode: str) -> tuple:
+    """
+    Executa uma operação sintética; retorna (exceção?, erro de aplicação?). Via fluxo_assessor,
+    erro de aplicação é a resposta de fallback do roteador (falha de parse) ou uma tool do
+    especialista que devolveu status de erro.
+    """
+    text = random.choice(MENSAGENS[kind]).format(v=f"{random.uniform(5, 300):.2f}")
+    via_agent = mode == "agent" or (mode == "mixed" and random.random() < 0.5)
+    if via_agent or kind == "faq":
+        tool_errors = ToolErrors()
+        token = _tool_errors.set(tool_errors)
+        try:
+            reply = main.fluxo_assessor(text, session_id, user_id=user_id)
+        finally:
+            _tool_errors.reset(token)
+        return False, reply == FALLBACK_REPLY or tool_errors.errors > 0
+    name, args = tool_call_for(kind, text)
+    with pg_tools.user_scope(user_id):
+        result = getattr(pg_tools, name).invoke(args)
+    return False, result.get("status") != "ok"
+
+
+def session_loop(i: int, args, stats: Stats, stop: threading.Event) -> None:
+    session_id = f"load-{i}"
+    user_id = f"load-user-{i % args.users}"
+    kinds, weights = zip(*MIX.items())
+    stop.wait(args.ramp_up * i / max(1, args.sessions))
+    while not stop.is_set():
+        kind = random.choices(kinds, weights)[0]
+        start = time.perf_counter()
+        try:
+            exception, app_error = run_operation(kind, session_id, user_id, args.mode)
+        except Exception:
+            exception, app_error = True, False
+        stats.record(kind, time.perf_counter() - start, exception, app_error)
+        if args.think_ms:
+            stop.wait(random.expovariate(1000.0 / args.think_ms))
+
+
+def main_cli(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Load/soak test do Assessor.AI com modelos stub.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessões concorrentes.")
+    parser.add_argument("--users", type=int, default=5, help="Usuários distintos (sessões são distribuídas entre eles).")
+    parser.add_argument("--duration", type=float, default=60, help="Duração em segundos.")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Segundos para iniciar todas as sessões.")
+    parser.add_argument("--think-ms", type=float, default=200, help="Pausa média entre operações de uma sessão.")
+    parser.add_argument("--model-latency-ms", type=float, default=300, help="Latência média dos modelos stub.")
+    parser.add_argument("--mode", choices=["agent", "direct", "mixed"], default="mixed")
+    parser.add_argument("--report-every", type=float, default=10, help="Intervalo dos relatórios parciais (s).")
+    parser.add_argument("--cleanup", action="store_true", help="Apaga as transações dos usuários load-user-* ao final.")
+    args = parser.parse_args(argv)
+
+    stub = StubChatModel(latency_s=args.model_latency_ms / 1000.0)
+    main.llm.inner = stub
+    main.llm_fast.inner = stub
+
+    stats = Stats()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=session_loop, args=(i, args, stats, stop), name=f"session-{i}", daemon=True)
+        for i in range(args.sessions)
+    ]
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+
+    print("tempo_s  ops/s    p50_ms   p95_ms   p99_ms  erros  conns_db  pool  sessões  mensagens  rss_mb")
+    last = started
+    while time.perf_counter() - started < args.duration:
+        time.sleep(min(args.report_every, max(0.0, args.duration - (time.perf_counter() - started))))
+        now = time.perf_counter()
+        window = stats.take_window()
+        p = percentiles(window)
+        errors = sum(stats.exceptions.values()) + sum(stats.app_errors.values())
+        sessions, messages = store_size()
+        try:
+            conns = db_connections()
+        except Exception:
+            conns = -1
+        print(
+            f"{now - started:7.0f} {len(window) / (now - last):7.1f} {p['p50'] * 1000:8.0f} {p['p95'] * 1000:8.0f}"
+            f" {p['p99'] * 1000:8.0f} {errors:6d} {conns:9d} {pool_in_use():5d} {sessions:8d} {messages:10d} {rss_mb():7.1f}",
+            flush=True,
+        )
+        last = now
+
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+    elapsed = time.perf_counter() - started
+
+    total = sum(stats.ops.values())
+    print(f"\n{total} operações em {elapsed:.0f}s = {total / elapsed:.1f} ops/s ({args.sessions} sessões, modo {args.mode})")
+    print(f"{'tipo':8} {'ops':>7} {'exceç.':>7} {'erro_app':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    for kind in MIX:
+        p = percentiles(stats.latencies[kind])
+        print(
+            f"{kind:8} {stats.ops[kind]:7d} {stats.exceptions[kind]:7d} {stats.app_errors[kind]:8d}"
+            f" {p['p50'] * 1000:8.0f} {p['p95'] * 1000:8.0f} {p['p99'] * 1000:8.0f} {p['max'] * 1000:8.0f}"
+        )
+    sessions, messages = store_size()
+    print(f"store: {sessions} sessões, {messages} mensagens; rss {rss_start:.1f} -> {rss_mb():.1f} MB")
+    print(f"llm: {main.llm.stats()}")
+    print(f"llm_fast: {main.llm_fast.stats()}")
+    print(f"faq cache: {faq_tool.faq_answer_cache.stats()}")
+    print(f"prompts: {main.prompt_sizes.report()}")
+    print(f"roteador: {main.route_parser.stats()}")
+    if pg_tools.WRITE_BATCHING:
+        print(f"write queue: {pg_tools._add_transaction_queue().stats()}")
+    if main.SPECULATIVE:
+        print(f"especulação: {main.speculator.stats()}")
+
+    if args.cleanup:
+        for u in range(args.users):
+            with pg_tools.user_scope(f"load-user-{u}"):
+                conn = pg_tools.get_conn()
+                try:
+                    cur = conn.cursor()
+                    user_id = pg_tools._apply_user_scope(cur)
+                    cur.execute("DELETE FROM transactions WHERE user_id = %s;", (user_id,))
+                    conn.commit()
+                finally:
+                    pg_tools.release_conn(conn)
+
+
+if __name__ == "__main__":
+    main_cli(sys.argv[1:])
@@ -1,4 +1,4 @@
-from faq_tool import get_faq_context
+from faq_tool import get_faq_context, embed_question, faq_index_version, faq_answer_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import (
     ChatPromptTemplate,
@@ -8,22 +8,26 @@ from langchain_core.prompts import (
 )
 from langchain_core.prompts.few_shot import FewShotChatMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-from pg_tools import TOOLS
+from pg_tools import TOOLS, user_scope
+from llm_guard import guarded
+from speculative import SpeculativeRunner
+from prompt_prefix import StaticPrefix, prompt_sizes
+from route_decision import RouteDecision, RouteParser, parse_route_text
 
-from datetime import datetime
 from zoneinfo import ZoneInfo
 from operator import itemgetter
 from dotenv import load_dotenv
 import os
+import time
 
 
 TZ = ZoneInfo("America/Sao_Paulo")
-today = datetime.now(TZ).date()
 
 
 store = {}
@@ -35,29 +39,37 @@ def get_session_history(session_id) -> ChatMessageHistory:
 
 load_dotenv()
 
-llm = ChatGoogleGenerativeAI(
+# Concorrência, limite de taxa, retries com backoff e coalescência ficam no guard
+# (llm_guard.py), então o cliente do provedor faz uma única tentativa.
+llm = guarded(ChatGoogleGenerativeAI(
     model='gemini-2.5-flash',
     temperature = 0.7,
     top_p=0.95,
+    max_retries=1,
     google_api_key=os.getenv("GEMINI_API_KEY")
-)
+), "main")
 
-llm_fast = ChatGoogleGenerativeAI(
+llm_fast = guarded(ChatGoogleGenerativeAI(
     model='gemini-2.0-flash',
     temperature = 0,
+    max_retries=1,
     google_api_key=os.getenv("GEMINI_API_KEY")
-)
+), "fast")
 
-# prompt do agente roteador
-system_prompt_roteador = ("system",
-    """
+# Persona comum: vai na parte fixa do prompt de cada agente, em vez de ser copiada
+# pelo roteador para cada mensagem encaminhada.
+PERSONA_SISTEMA = """
 ### PERSONA SISTEMA
 Você é o Assessor.AI — um assistente pessoal de compromissos e finanças. É objetivo, responsável, confiável e empático, com foco em utilidade imediata. Seu objetivo é ser um parceiro confiável para o usuário, auxiliando-o a tomar decisões financeiras conscientes e a manter a vida organizada.
 - Evite jargões.
 - Evite ser prolixo.
 - Não invente dados.
 - Respostas sempre curtas e aplicáveis.
-- Hoje é {today_local} (America/Sao_Paulo). Interprete datas relativas a partir desta data.
+"""
+
+# prompt do agente roteador
+system_prompt_roteador = ("system", PERSONA_SISTEMA +
+    """- Hoje é {today_local} (America/Sao_Paulo). Interprete datas relativas a partir desta data.
 
 
 ### PAPEL
@@ -68,7 +80,7 @@ Você é o Assessor.AI — um assistente pessoal de compromissos e finanças. É
   (b) fora de escopo (redirecionando para finanças/agenda).
 - Seu objetivo é conversar de forma amigável com o usuário e tentar identificar se ele menciona algo sobre finanças ou agenda.
 - Em fora_escopo: ofereça 1-2 sugestões práticas para voltar ao seu escopo (ex.: agendar algo, registrar/consultar um gasto).
-- Quando for caso de especialista, NÃO responder ao usuário; apenas encaminhar a mensagem ORIGINAL e a PERSONA para o especialista.
+- Quando for caso de especialista, NÃO responder ao usuário; apenas encaminhar a mensagem ORIGINAL para o especialista.
 
 
 ### REGRAS
@@ -84,17 +96,12 @@ Você é o Assessor.AI — um assistente pessoal de compromissos e finanças. É
 ### PROTOCOLO DE ENCAMINHAMENTO (texto puro)
 ROUTE=<financeiro|agenda|faq>
 PERGUNTA_ORIGINAL=<mensagem completa do usuário, sem edições>
-PERSONA=<copie o bloco "PERSONA SISTEMA" daqui>
 CLARIFY=<pergunta mínima se precisar; senão deixe vazio>
 
 
 ### SAÍDAS POSSÍVEIS
 - Resposta direta (texto curto) quando saudação ou fora de escopo.
 - Encaminhamento ao especialista usando exatamente o protocolo acima.
-
-
-### HISTÓRICO DA CONVERSA
-{chat_history}
 """
 )
 
@@ -117,7 +124,7 @@ shots_roteador = [
     # 3) Finanças -> encaminhar (protocolo textual)
     {
         "human": "Quanto gastei com mercado no mês passado?",
-        "ai": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
+        "ai": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nCLARIFY="
     },
     # 4) Ambíguo -> pedir 1 clarificação mínima (texto direto, sem encaminhar)
     {
@@ -127,7 +134,7 @@ shots_roteador = [
     # 5) Agenda -> encaminhar (protocolo textual) — exemplo explícito
     {
         "human": "Tenho reunião amanhã às 9h?",
-        "ai": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho reunião amanhã às 9h?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
+        "ai": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho reunião amanhã às 9h?\nCLARIFY="
     },
 ]
 
@@ -136,8 +143,39 @@ fewshots_roteador = FewShotChatMessagePromptTemplate(
     example_prompt=example_prompt_base
 )
 
+# Modo estruturado (ASSESSOR_ROUTER_MODE=structured): a decisão vem numa tool call
+# RouteDecision, em vez do protocolo em texto. Os shots mostram as mesmas decisões como
+# tool calls (com a resposta da tool, como numa conversa real com function calling).
+ROUTER_STRUCTURED = os.getenv("ASSESSOR_ROUTER_MODE", "text") == "structured"
+
+system_prompt_roteador_estruturado = ("system",
+    system_prompt_roteador[1].replace("- Responda de forma textual.\n", "").split("### PROTOCOLO DE ENCAMINHAMENTO")[0]
+    + """### DECISÃO DE ROTA (RouteDecision)
+Sempre responda chamando RouteDecision:
+- route=financeiro|agenda|faq para encaminhar ao especialista; pergunta_original = mensagem completa do usuário, sem edições; clarify = pergunta mínima se precisar, senão vazio.
+- route=responder para saudação, fora de escopo ou clarificação de rota; resposta = texto curto ao usuário.
+"""
+)
+
+def _shot_roteador_estruturado(i: int, shot: dict) -> list:
+    decisao = parse_route_text(shot["ai"], shot["human"]) or RouteDecision(route="responder", resposta=shot["ai"])
+    call_id = f"shot_roteador_{i}"
+    return [
+        HumanMessage(content=shot["human"]),
+        AIMessage(content="", tool_calls=[{
+            "name": RouteDecision.__name__,
+            "args": decisao.model_dump(exclude_defaults=True),
+            "id": call_id,
+        }]),
+        ToolMessage(content="ok", tool_call_id=call_id),
+    ]
+
+fewshots_roteador_estruturado = [
+    message for i, shot in enumerate(shots_roteador, start=1) for message in _shot_roteador_estruturado(i, shot)
+]
 
-system_prompt_faq = ("system",
+
+system_prompt_faq = ("system", PERSONA_SISTEMA +
     """
 ### PAPEL
 Você deve responder perguntas sobre dúvidas SOMENTE com base no documento normativo oficial (trechos fornecidos em CONTEXTO).
@@ -153,32 +191,53 @@ Se a informação solicitada não constar no documento, diga: "Não tem essa inf
 ### ENTRADA
     - ROUTE=faq
     - PERGUNTA_ORIGINAL=...
-    - PERSONA=...    (use como diretriz de concisão/objetividade)
     - CLARIFY=...    (se preenchido, responda primeiro)
 """
 )
 
+prefixo_faq = StaticPrefix("faq", system_prompt_faq)
+
 prompt_faq = ChatPromptTemplate.from_messages([
-    system_prompt_faq,
+    MessagesPlaceholder("prefixo"),         # system pré-renderizado
     ("human",
      "Pergunta do usuário:\n{question}\n\n"
      "CONTEXTO (trechos do documento):\n{context}\n\n"
      "Responda com base APENAS no CONTEXTO.")
-])
+]).partial(prefixo=prefixo_faq.messages)
 
 faq_chain_core = (
     RunnablePassthrough.assign(
         question=itemgetter("input"),            
-        context=lambda x: get_faq_context(x["input"])  
+        context=lambda x: x.get("context") or get_faq_context(x["input"], x.get("embedding"))  
     )
     | prompt_faq 
     | llm_fast 
     | StrOutputParser()
-)
+).with_config(metadata={"prompt": "faq"}, callbacks=[prompt_sizes])
+
+def buscar_faq(pergunta: str) -> dict:
+    # Embedding + trechos do FAQ; pode rodar antecipadamente, em paralelo ao roteador
+    embedding = embed_question(pergunta)
+    return {"embedding": embedding, "context": get_faq_context(pergunta, embedding)}
+
+def responder_faq(pergunta: str, prefetched: dict = None) -> str:
+    # Reaproveita a resposta de uma pergunta semelhante já respondida (mesma versão do PDF)
+    embedding = prefetched["embedding"] if prefetched else embed_question(pergunta)
+    version = faq_index_version()
+    cached = faq_answer_cache.lookup(embedding, version)
+    if cached is not None:
+        return cached
+    resposta = faq_chain_core.invoke({
+        "input": pergunta,
+        "embedding": embedding,
+        "context": prefetched["context"] if prefetched else None,
+    })
+    faq_answer_cache.store(embedding, resposta, version, question=pergunta)
+    return resposta
 
 # -------------------- PROMPTS ESPECIALISTAS --------------------
 # prompt do agente financeiro
-system_prompt_financeiro = ("system",
+system_prompt_financeiro = ("system", PERSONA_SISTEMA +
     """
     ### OBJETIVO
     Interpretar a PERGUNTA_ORIGINAL sobre finanças e operar as tools de transactions para responder. 
@@ -197,12 +256,11 @@ system_prompt_financeiro = ("system",
     - Entrada vem do Roteador via protocolo:
     - ROUTE=financeiro
     - PERGUNTA_ORIGINAL=...
-    - PERSONA=...   (use como diretriz de concisão/objetividade)
     - CLARIFY=...   (se preenchido, priorize responder esta dúvida antes de prosseguir)
 
 
     ### REGRAS
-    - Use o {chat_history} para resolver referências ao contexto recente.
+    - Use o histórico da conversa para resolver referências ao contexto recente.
 
 
 
@@ -219,25 +277,21 @@ system_prompt_financeiro = ("system",
      - escrita        : {{"operacao":"adicionar|atualizar|deletar","id":123}}
      - janela_tempo   : {{"de":"YYYY-MM-DD","ate":"YYYY-MM-DD","rotulo":'mês passado'}}
      - indicadores    : {{chaves livres e numéricas úteis ao log}}
-
-
-    ### HISTÓRICO DA CONVERSA
-    {chat_history}
     """
 )
 
 # Especialista financeiro (mesmo example_prompt_pair)
 shots_financeiro = [
     {
-        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nCLARIFY=",
         "ai": """{{"dominio":"financeiro","intencao":"consultar","resposta":"Você gastou R$ 842,75 com 'comida' no mês passado.","recomendacao":"Quer detalhar por estabelecimento?","janela_tempo":{{"de":"2025-08-01","ate":"2025-08-31","rotulo":"mês passado (ago/2025)"}}}}"""
     },
     {
-        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Registrar almoço hoje R$ 45 no débito\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Registrar almoço hoje R$ 45 no débito\nCLARIFY=",
         "ai": """{{"dominio":"financeiro","intencao":"inserir","resposta":"Lancei R$ 45,00 em 'comida' hoje (débito).","recomendacao":"Deseja adicionar uma observação?","escrita":{{"operacao":"adicionar","id":2045}}}}"""
     },
     {
-        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quero um resumo dos gastos\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quero um resumo dos gastos\nCLARIFY=",
         "ai": """{{"dominio":"financeiro","intencao":"resumo","resposta":"Preciso do período para seguir.","recomendacao":"","esclarecer":"Qual período considerar (ex.: hoje, esta semana, mês passado)?"}}"""
     },
 ]
@@ -249,7 +303,7 @@ fewshots_financeiro = FewShotChatMessagePromptTemplate(
 
 ############################
 # prompt do agente de agenda
-system_prompt_agenda = ("system",
+system_prompt_agenda = ("system", PERSONA_SISTEMA +
     """
     ### OBJETIVO
     Interpretar a PERGUNTA_ORIGINAL sobre agenda/compromissos e (quando houver tools) consultar/criar/atualizar/cancelar eventos. 
@@ -268,12 +322,11 @@ system_prompt_agenda = ("system",
     - Entrada do Roteador:
     - ROUTE=agenda
     - PERGUNTA_ORIGINAL=...
-    - PERSONA=...   (use como diretriz de concisão/objetividade)
     - CLARIFY=...   (se preenchido, responda primeiro)
 
 
     ### REGRAS
-    - Use o {chat_history} para resolver referências ao contexto recente.
+    - Use o histórico da conversa para resolver referências ao contexto recente.
 
 
     ### SAÍDA (JSON)
@@ -287,24 +340,20 @@ system_prompt_agenda = ("system",
      - esclarecer     : pergunta mínima de clarificação
      - janela_tempo   : {{"de":"YYYY-MM-DDTHH:MM","ate":"YYYY-MM-DDTHH:MM","rotulo":"ex.: 'amanhã 09:00–10:00'"}}
      - evento         : {{"titulo":"...","data":"YYYY-MM-DD","inicio":"HH:MM","fim":"HH:MM","local":"...","participantes":["..."]}}
-
-
-     ### HISTÓRICO DA CONVERSA
-    {chat_history}
     """
 )
 
 shots_agenda = [
     {
-        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho janela amanhã à tarde?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho janela amanhã à tarde?\nCLARIFY=",
         "ai": """{{"dominio":"agenda","intencao":"disponibilidade","resposta":"Você está livre amanhã das 14:00 às 16:00.","recomendacao":"Quer reservar 15:00–16:00?","janela_tempo":{{"de":"2025-09-29T14:00","ate":"2025-09-29T16:00","rotulo":"amanhã 14:00–16:00"}}}}"""
     },
     {
-        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Marcar reunião com João amanhã às 9h por 1 hora\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Marcar reunião com João amanhã às 9h por 1 hora\nCLARIFY=",
         "ai": """{{"dominio":"agenda","intencao":"criar","resposta":"Posso criar 'Reunião com João' amanhã 09:00–10:00.","recomendacao":"Confirmo o envio do convite?","janela_tempo":{{"de":"2025-09-29T09:00","ate":"2025-09-29T10:00","rotulo":"amanhã 09:00–10:00"}},"evento":{{"titulo":"Reunião com João","data":"2025-09-29","inicio":"09:00","fim":"10:00","local":"online"}}}}"""
     },
     {
-        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Agendar revisão do orçamento na sexta\nPERSONA={PERSONA_SISTEMA}\nCLARIFY=",
+        "human": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Agendar revisão do orçamento na sexta\nCLARIFY=",
         "ai": """{{"dominio":"agenda","intencao":"criar","resposta":"Preciso do horário para agendar.","recomendacao":"","esclarecer":"Qual horário você prefere na sexta?"}}"""
     },
 ]
@@ -376,38 +425,41 @@ A região abaixo é apenas para exemplo, você não deve considerá-la para resp
 O usuário não sabe e não deve saber dos dados dos shots.
 """
 
+# A parte fixa de cada prompt (system, alerta e shots) é renderizada uma vez por dia
+# (StaticPrefix); a cada chamada só são formatados o histórico e a entrada.
+if ROUTER_STRUCTURED:
+    prefixo_roteador = StaticPrefix("roteador", system_prompt_roteador_estruturado, cut_shots, *fewshots_roteador_estruturado)
+else:
+    prefixo_roteador = StaticPrefix("roteador", system_prompt_roteador, cut_shots, fewshots_roteador)
+prefixo_financeiro = StaticPrefix("financeiro", system_prompt_financeiro, cut_shots, fewshots_financeiro)
+prefixo_agenda = StaticPrefix("agenda", system_prompt_agenda, cut_shots, fewshots_agenda)
+prefixo_orquestrador = StaticPrefix("orquestrador", system_prompt_orquestrador, cut_shots, fewshots_orquestrador)
+prompt_sizes.register(prefixo_faq, prefixo_roteador, prefixo_financeiro, prefixo_agenda, prefixo_orquestrador)
+
 prompt_roteador = ChatPromptTemplate.from_messages([
-    system_prompt_roteador,                 # system prompt
-    cut_shots,
-    fewshots_roteador,                      # Shots human/ai 
+    MessagesPlaceholder("prefixo"),         # system prompt + shots
     MessagesPlaceholder("chat_history"),    # memória
     ("human", "{input}"),                   # user prompt
-]).partial(today_local=today.isoformat())
+]).partial(prefixo=prefixo_roteador.messages)
 
 prompt_financeiro = ChatPromptTemplate.from_messages([
-    system_prompt_financeiro,               # system prompt
-    cut_shots,
-    fewshots_financeiro,                    # Shots human/ai 
+    MessagesPlaceholder("prefixo"),         # system prompt + shots
     MessagesPlaceholder("chat_history"),    # memória
     ("human", "{input}"),                   # user prompt
     MessagesPlaceholder("agent_scratchpad") # Valor padrão para o agente de buscar dados
 
-]).partial(today_local=today.isoformat())
+]).partial(prefixo=prefixo_financeiro.messages)
 prompt_agenda = ChatPromptTemplate.from_messages([
-    system_prompt_agenda,                   # system prompt
-    cut_shots,
-    fewshots_agenda,                        # Shots human/ai 
+    MessagesPlaceholder("prefixo"),         # system prompt + shots
     MessagesPlaceholder("chat_history"),    # memória
     ("human", "{input}"),                   # user prompt
     MessagesPlaceholder("agent_scratchpad") # Valor padrão para o agente de buscar dados
-]).partial(today_local=today.isoformat())
+]).partial(prefixo=prefixo_agenda.messages)
 prompt_orquestrador = ChatPromptTemplate.from_messages([
-    system_prompt_orquestrador,             # system prompt
-    cut_shots,
-    fewshots_orquestrador,                  # Shots human/ai 
+    MessagesPlaceholder("prefixo"),         # system prompt + shots
     MessagesPlaceholder("chat_history"),    # memória
     ("human", "{input}"),                   # user prompt
-]).partial(today_local=today.isoformat())
+]).partial(prefixo=prefixo_orquestrador.messages)
 
 
 financeiro_agent = create_tool_calling_agent(llm, TOOLS, prompt_financeiro)
@@ -425,7 +477,7 @@ financeiro_executor = RunnableWithMessageHistory(
     get_session_history=get_session_history,
     input_messages_key="input",
     history_messages_key="chat_history"
-)
+).with_config(metadata={"prompt": "financeiro"}, callbacks=[prompt_sizes])
 
 agenda_agent = create_tool_calling_agent(llm, [], prompt_agenda)
 
@@ -442,31 +494,72 @@ agenda_executor = RunnableWithMessageHistory(
     get_session_history=get_session_history,
     input_messages_key="input",
     history_messages_key="chat_history"
-)
+).with_config(metadata={"prompt": "agenda"}, callbacks=[prompt_sizes])
+
+# A saída do roteador (tool call ou texto) vira uma RouteDecision sem nova chamada ao modelo;
+# desvios de formato são corrigidos pelo parser tolerante. Métricas em route_parser.stats().
+route_parser = RouteParser()
+llm_roteador = llm_fast.bind_tools([RouteDecision], tool_choice="any") if ROUTER_STRUCTURED else llm_fast
+
+def _decidir_rota(x: dict) -> dict:
+    decisao = route_parser.parse(x["mensagem"], x["input"])
+    return {"decisao": decisao, "texto": decisao.texto()}
 
 router_chain = RunnableWithMessageHistory(
-    prompt_roteador | llm_fast | StrOutputParser(),
+    RunnablePassthrough.assign(mensagem=prompt_roteador | llm_roteador) | RunnableLambda(_decidir_rota),
     get_session_history=get_session_history,
     input_messages_key="input",
+    output_messages_key="texto",            # no histórico fica o protocolo ou a resposta direta
     history_messages_key="chat_history"
-)
+).with_config(metadata={"prompt": "roteador"}, callbacks=[prompt_sizes])
 
 orchestrator_chain = RunnableWithMessageHistory(
     prompt_orquestrador | llm_fast | StrOutputParser(),
     get_session_history=get_session_history,
     input_messages_key="input",
     history_messages_key="chat_history"
-)
+).with_config(metadata={"prompt": "orquestrador"}, callbacks=[prompt_sizes])
 
-def fluxo_assessor(pergunta, session_id):
-    resposta = router_chain.invoke(
-        {"input": pergunta},
-        config={"configurable": {"session_id": session_id}}
-    )
+def fluxo_assessor(pergunta, session_id, user_id=None):
+    # As tools do banco só enxergam as transações do usuário da sessão
+    with user_scope(user_id):
+        return _fluxo_assessor(pergunta, session_id)
+
+# Modo especulativo: enquanto o roteador decide, já busca os trechos do FAQ. Se a rota
+# confirmar, usa o resultado; senão descarta. Métricas em speculator.stats().
+SPECULATIVE = os.getenv("ASSESSOR_SPECULATIVE", "0") == "1"
+speculator = SpeculativeRunner()
 
-    if str(resposta).startswith("ROUTE="):
-        route = resposta.split("\n")[0].split("=")[1]
+def _fluxo_assessor(pergunta, session_id):
+    especulacao = {}
+    if SPECULATIVE:
+        especulacao = speculator.start(
+            faq=lambda: buscar_faq(pergunta),
+        )
 
+    try:
+        saida = router_chain.invoke(
+            {"input": pergunta},
+            config={"configurable": {"session_id": session_id}}
+        )
+    except Exception:
+        for tarefa in especulacao.values():
+            speculator.discard(tarefa)
+        raise
+    decidido_em = time.monotonic()
+
+    decisao = saida["decisao"]
+    resposta = saida["texto"]
+    route = decisao.route if decisao.encaminhar else None
+
+    prefetched_faq = None
+    for nome, tarefa in especulacao.items():
+        if nome == "faq" and route == "faq" and decisao.pergunta_original == pergunta.strip():
+            prefetched_faq = speculator.take(tarefa, decidido_em)
+        else:
+            speculator.discard(tarefa)
+
+    if route:
         if route == "financeiro":
             resposta = financeiro_executor.invoke(
                 {"input": resposta},
@@ -480,8 +573,7 @@ def fluxo_assessor(pergunta, session_id):
             )["output"]
 
         elif route == "faq": 
-            original = resposta.split("PERGUNTA_ORIGINAL=")[1].split("\n")[0].strip()
-            resposta = faq_chain_core.invoke({"input": original})
+            resposta = responder_faq(decisao.pergunta_original, prefetched_faq)
 
     
         if route in ["financeiro", "agenda"]:
@@ -490,6 +582,7 @@ def fluxo_assessor(pergunta, session_id):
                 config={"configurable": {"session_id": session_id}}
             )
     return resposta
+
     
 
     
@@ -497,15 +590,22 @@ def fluxo_assessor(pergunta, session_id):
         
 
 
-while True:
-    user_input = input("> ")
-    if user_input.lower() in ('sair', 'end', 'fim', 'tchau', 'bye'):
-        print("Fim da conversa")
-        break
+# PROMPT_SIZE_REPORT=1 mostra, após cada resposta, os tokens enviados por chain (prompt_prefix.py).
+PROMPT_SIZE_REPORT = os.getenv("PROMPT_SIZE_REPORT", "0") == "1"
 
-    try:
-        resposta = fluxo_assessor(user_input, "PRECISA_MAIS_NAO_IMPORTA")
-        print(resposta)
-        
-    except Exception as e:
-        print("Erro: ",e)
\ No newline at end of file
+if __name__ == "__main__":
+    while True:
+        user_input = input("> ")
+        if user_input.lower() in ('sair', 'end', 'fim', 'tchau', 'bye'):
+            print("Fim da conversa")
+            break
+
+        try:
+            # CLI de um só usuário: as linhas sem dono explícito ficam com 'default' (migração 002)
+            resposta = fluxo_assessor(user_input, "PRECISA_MAIS_NAO_IMPORTA", user_id=os.getenv("DEFAULT_USER_ID") or "default")
+            print(resposta)
+            if PROMPT_SIZE_REPORT:
+                print(prompt_sizes.report())
+
+        except Exception as e:
+            print("Erro: ",e)
\ No newline at end of file
@@ -0,0 +1,156 @@
+-- Particionamento declarativo de transactions por mês (occurred_at).
+--
+-- Os limites das partições são meses LOCAIS (America/Sao_Paulo), os mesmos
+-- usados pelos filtros de data das tools em pg_tools.py, então filtros por
+-- dia/intervalo local caem em uma única partição (ou poucas).
+--
+-- A tabela antiga é mantida como transactions_legacy; remova-a depois de validar.
+
+BEGIN;
+
+ALTER TABLE transactions RENAME TO transactions_legacy;
+
+CREATE TABLE transactions (
+    LIKE transactions_legacy
+        INCLUDING DEFAULTS
+        INCLUDING IDENTITY
+        INCLUDING GENERATED
+        INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (occurred_at);
+
+ALTER TABLE transactions ALTER COLUMN occurred_at SET NOT NULL;
+ALTER TABLE transactions ALTER COLUMN occurred_at SET DEFAULT NOW();
+
+-- A chave primária de uma tabela particionada precisa conter a chave de partição.
+ALTER TABLE transactions ADD PRIMARY KEY (id, occurred_at);
+ALTER TABLE transactions
+    ADD FOREIGN KEY ("type") REFERENCES transaction_types (id),
+    ADD FOREIGN KEY (category_id) REFERENCES categories (id);
+
+CREATE INDEX ON transactions (occurred_at);
+CREATE INDEX ON transactions ("type", occurred_at);
+
+-- id pode ser serial ou identity:
+-- - serial: o DEFAULT nextval() veio com INCLUDING DEFAULTS, mas a sequência pertence à
+--   tabela antiga: passa a pertencer à nova.
+-- - identity: INCLUDING IDENTITY já criou uma sequência própria para a nova tabela, e a
+--   sequência de uma identity não pode mudar de dono; nada a fazer aqui (o INSERT abaixo
+--   usa OVERRIDING SYSTEM VALUE e o setval ajusta a sequência nova).
+DO $$
+DECLARE
+    seq text := pg_get_serial_sequence('transactions_legacy', 'id');
+    is_identity boolean := (
+        SELECT attidentity <> ''
+        FROM pg_attribute
+        WHERE attrelid = 'transactions_legacy'::regclass AND attname = 'id'
+    );
+BEGIN
+    IF seq IS NOT NULL AND NOT is_identity THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY transactions.id', seq);
+    END IF;
+END $$;
+
+CREATE SCHEMA IF NOT EXISTS transactions_archive;
+
+
+-- Cria (se não existirem) as partições mensais de p_from até p_months_ahead meses
+-- após o mês corrente. Nome: transactions_pYYYYMM.
+CREATE OR REPLACE FUNCTION transactions_ensure_partitions(
+    p_from date DEFAULT (NOW() AT TIME ZONE 'America/Sao_Paulo')::date,
+    p_months_ahead int DEFAULT 3
+) RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+    m date := date_trunc('month', p_from)::date;
+    last_month date := (date_trunc('month', NOW() AT TIME ZONE 'America/Sao_Paulo')
+                        + make_interval(months => p_months_ahead))::date;
+    part text;
+    created int := 0;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := 'transactions_p' || to_char(m, 'YYYYMM');
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                part,
+                m::timestamp AT TIME ZONE 'America/Sao_Paulo',
+                (m + interval '1 month')::timestamp AT TIME ZONE 'America/Sao_Paulo'
+            );
+            created := created + 1;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END $$;
+
+
+-- Hook de retenção/arquivamento: desanexa as partições cujo mês termina antes de
+-- p_before e as move para o schema transactions_archive (p_drop = true as remove).
+-- Retorna os nomes das partições processadas.
+CREATE OR REPLACE FUNCTION transactions_archive_partitions(
+    p_before date,
+    p_drop boolean DEFAULT false
+) RETURNS SETOF text
+LANGUAGE plpgsql AS $$
+DECLARE
+    part text;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'transactions'::regclass
+          AND c.relname ~ '^transactions_p[0-9]{6}$'
+          AND (to_date(substr(c.relname, 15), 'YYYYMM') + interval '1 month') <= p_before
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE transactions DETACH PARTITION %I', part);
+        IF p_drop THEN
+            EXECUTE format('DROP TABLE %I', part);
+        ELSE
+            EXECUTE format('ALTER TABLE %I SET SCHEMA transactions_archive', part);
+        END IF;
+        RETURN NEXT part;
+    END LOOP;
+END $$;
+
+
+-- Partições para todo o histórico + 3 meses à frente; o default só recebe o que
+-- escapar disso (ex.: datas muito no futuro) e deve ficar vazio.
+SELECT transactions_ensure_partitions(
+    COALESCE((SELECT MIN(occurred_at AT TIME ZONE 'America/Sao_Paulo')::date FROM transactions_legacy),
+             (NOW() AT TIME ZONE 'America/Sao_Paulo')::date),
+    3
+);
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+-- OVERRIDING SYSTEM VALUE mantém os ids antigos quando id é GENERATED ALWAYS AS IDENTITY
+-- (sem identity, a cláusula não tem efeito).
+INSERT INTO transactions OVERRIDING SYSTEM VALUE SELECT * FROM transactions_legacy;
+
+-- Serve para os dois casos: pg_get_serial_sequence também devolve a sequência da identity.
+DO $$
+DECLARE
+    seq text := pg_get_serial_sequence('transactions', 'id');
+BEGIN
+    IF seq IS NOT NULL THEN
+        PERFORM setval(seq, COALESCE((SELECT MAX(id) FROM transactions), 0) + 1, false);
+    END IF;
+END $$;
+
+COMMIT;
+
+ANALYZE transactions;
+
+-- Criação automática das partições futuras: com pg_cron, agenda diariamente;
+-- sem pg_cron, rode "SELECT transactions_ensure_partitions();" num cron externo.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'transactions_ensure_partitions',
+            '0 3 * * *',
+            'SELECT transactions_ensure_partitions()'
+        );
+    END IF;
+END $$;
@@ -0,0 +1,22 @@
+-- Dimensão de usuário em transactions.
+--
+-- As linhas existentes ficam com o usuário 'default' (numa implantação de um só
+-- usuário, configure DEFAULT_USER_ID=default para continuar vendo-as pelas tools
+-- fora de user_scope). As tools sempre filtram por user_id, então
+-- o índice (user_id, occurred_at) limita cada consulta à faixa do usuário.
+
+BEGIN;
+
+ALTER TABLE transactions ADD COLUMN user_id text NOT NULL DEFAULT 'default';
+ALTER TABLE transactions ALTER COLUMN user_id DROP DEFAULT;
+
+-- Substitui os índices da 001 (occurred_at) e ("type", occurred_at): toda consulta
+-- agora filtra por usuário.
+DROP INDEX IF EXISTS transactions_occurred_at_idx;
+DROP INDEX IF EXISTS transactions_type_occurred_at_idx;
+CREATE INDEX transactions_user_occurred_at_idx ON transactions (user_id, occurred_at);
+CREATE INDEX transactions_user_type_occurred_at_idx ON transactions (user_id, "type", occurred_at);
+
+COMMIT;
+
+ANALYZE transactions;
@@ -0,0 +1,116 @@
+-- Verificação da poda de partições com um volume sintético (~10M linhas).
+-- Rode em um banco de teste depois de 001_partition_transactions.sql e
+-- 002_transactions_user_id.sql:
+--   psql -f migrations/explain_partition_pruning.sql
+-- Em cada EXPLAIN, apenas transactions_pYYYYMM do(s) mês(es) filtrado(s) deve
+-- aparecer (ou "Subplans Removed" quando a poda ocorre na execução).
+--
+-- Os PREPARE abaixo são cópias de pg_queries.STATEMENTS (mesmo nome, mesmo SQL):
+-- mantenha-os em sincronia ao mudar as consultas das tools.
+
+SELECT transactions_ensure_partitions(DATE '2021-01-01', 3);
+
+-- 50 usuários sintéticos; as consultas abaixo olham só para 'bench_7'.
+INSERT INTO transactions (user_id, amount, "type", category_id, description, payment_method, occurred_at, source_text)
+SELECT
+    'bench_' || (g % 50),
+    round((random() * 500)::numeric, 2),
+    1 + (g % 3),
+    NULL,
+    NULL,
+    (ARRAY['débito', 'crédito', 'pix'])[1 + (g % 3)],
+    TIMESTAMPTZ '2021-01-01 00:00-03' + (g * interval '13 seconds'),
+    'lançamento sintético ' || g
+FROM generate_series(1, 10000000) AS g;
+
+ANALYZE transactions;
+
+-- query_transactions com date_local (query_tx_00_day)
+PREPARE query_tx_00_day AS
+    SELECT
+        t.id, t.amount, tt.type as type_name, c.name as category_name, t.description, t.payment_method, t.occurred_at, t.source_text
+    FROM
+        transactions t
+    JOIN
+        transaction_types tt ON t.type = tt.id
+    LEFT JOIN
+        categories c ON t.category_id = c.id
+    WHERE t.user_id = $1::text AND (t.occurred_at >= ($2::date)::timestamp AT TIME ZONE 'America/Sao_Paulo' AND t.occurred_at < (($2::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'))
+    LIMIT $3::int;
+
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE query_tx_00_day ('bench_7', '2024-03-15', 21);
+
+-- query_transactions com date_from_local/date_to_local (query_tx_00_range)
+PREPARE query_tx_00_range AS
+    SELECT
+        t.id, t.amount, tt.type as type_name, c.name as category_name, t.description, t.payment_method, t.occurred_at, t.source_text
+    FROM
+        transactions t
+    JOIN
+        transaction_types tt ON t.type = tt.id
+    LEFT JOIN
+        categories c ON t.category_id = c.id
+    WHERE t.user_id = $1::text AND (t.occurred_at >= ($2::date)::timestamp AT TIME ZONE 'America/Sao_Paulo' AND t.occurred_at < (($3::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'))
+    ORDER BY t.occurred_at ASC
+    LIMIT $4::int;
+
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE query_tx_00_range ('bench_7', '2024-03-01', '2024-04-30', 21);
+
+-- query_transactions com texto, tipo e intervalo (query_tx_11_range)
+PREPARE query_tx_11_range AS
+    SELECT
+        t.id, t.amount, tt.type as type_name, c.name as category_name, t.description, t.payment_method, t.occurred_at, t.source_text
+    FROM
+        transactions t
+    JOIN
+        transaction_types tt ON t.type = tt.id
+    LEFT JOIN
+        categories c ON t.category_id = c.id
+    WHERE t.user_id = $1::text AND (t.source_text ILIKE $2::text OR t.description ILIKE $2::text) AND t.type = $3::int AND (t.occurred_at >= ($4::date)::timestamp AT TIME ZONE 'America/Sao_Paulo' AND t.occurred_at < (($5::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'))
+    ORDER BY t.occurred_at ASC
+    LIMIT $6::int;
+
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE query_tx_11_range ('bench_7', '%sintético 7%', 2, '2024-03-01', '2024-04-30', 21);
+
+-- query_transactions com summary=true, tipo e intervalo (query_tx_sum_01_range)
+PREPARE query_tx_sum_01_range AS
+    SELECT
+        COUNT(*),
+        COALESCE(SUM(t.amount) FILTER (WHERE tt.type = 'INCOME'), 0),
+        COALESCE(SUM(t.amount) FILTER (WHERE tt.type = 'EXPENSES'), 0)
+    FROM
+        transactions t
+    JOIN
+        transaction_types tt ON t.type = tt.id
+    WHERE t.user_id = $1::text AND t.type = $2::int AND (t.occurred_at >= ($3::date)::timestamp AT TIME ZONE 'America/Sao_Paulo' AND t.occurred_at < (($4::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'));
+
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE query_tx_sum_01_range ('bench_7', 2, '2024-03-01', '2024-04-30');
+
+-- daily_balance
+PREPARE daily_balance AS
+    SELECT
+        SUM(CASE WHEN tt.type = 'INCOME' THEN t.amount ELSE -t.amount END)
+    FROM
+        transactions t
+    JOIN
+        transaction_types tt ON t.type = tt.id
+    WHERE
+        t.user_id = $1::text
+        AND tt.type IN ('INCOME', 'EXPENSES')
+        AND (t.occurred_at >= ($2::date)::timestamp AT TIME ZONE 'America/Sao_Paulo' AND t.occurred_at < (($2::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'));
+
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE daily_balance ('bench_7', '2024-03-15');
+
+-- Plano genérico (o que a conexão do pool usa após algumas execuções do mesmo
+-- statement): a poda passa a ocorrer na execução ("Subplans Removed").
+SET plan_cache_mode = force_generic_plan;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE daily_balance ('bench_7', '2024-03-15');
+RESET plan_cache_mode;
+
+DEALLOCATE ALL;
+
+-- Forma antiga (occurred_at::date = ...): varre todas as partições, para comparação
+EXPLAIN (COSTS OFF)
+SELECT count(*) FROM transactions t
+WHERE t.user_id = 'bench_7'
+  AND t.occurred_at::date = '2024-03-15'::date AT TIME ZONE 'America/Sao_Paulo';
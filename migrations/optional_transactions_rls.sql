@@ -0,0 +1,21 @@
+-- (Opcional) Row-level security em transactions, como segunda barreira além
+-- do filtro por user_id feito nas tools.
+--
+-- pg_tools.py publica o usuário da sessão com set_config('app.user_id', ...)
+-- antes de cada consulta; sem esse valor nenhuma linha é visível.
+-- Rode com o usuário dono da tabela. Para desfazer:
+--   ALTER TABLE transactions NO FORCE ROW LEVEL SECURITY;
+--   ALTER TABLE transactions DISABLE ROW LEVEL SECURITY;
+
+BEGIN;
+
+ALTER TABLE transactions ENABLE ROW LEVEL SECURITY;
+-- Aplica também ao dono da tabela (o usuário da aplicação costuma ser o dono).
+ALTER TABLE transactions FORCE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS transactions_user_isolation ON transactions;
+CREATE POLICY transactions_user_isolation ON transactions
+    USING (user_id = current_setting('app.user_id', true))
+    WITH CHECK (user_id = current_setting('app.user_id', true));
+
+COMMIT;
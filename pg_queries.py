@@ -0,0 +1,221 @@
+import os
+import re
+from itertools import product
+from typing import Sequence
+
+import psycopg2.extensions
+
+
+# PG_PREPARED_STATEMENTS=0 executa o mesmo SQL sem PREPARE (ex.: atrás de PgBouncer em modo transaction).
+USE_PREPARED = os.getenv("PG_PREPARED_STATEMENTS", "1") == "1"
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Conexão que lembra quais statements já foram preparados na sessão do servidor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.pool_key = None
+
+
+def local_date_range_sql(field: str, start: str = "%s", end: str = "%s") -> str:
+    """
+    Trecho SQL para o intervalo de dias locais [start, end] em America/Sao_Paulo.
+    start/end são os placeholders ("%s" ou "$n"). A coluna fica sem cast, então o
+    filtro permite a poda das partições mensais e, junto com t.user_id = ..., usa o
+    índice (user_id, occurred_at).
+    """
+    return (
+        f"({field} >= ({start}::date)::timestamp AT TIME ZONE 'America/Sao_Paulo'"
+        f" AND {field} < (({end}::date + 1)::timestamp AT TIME ZONE 'America/Sao_Paulo'))"
+    )
+
+
+def query_transactions_name(text: bool, type_filter: bool, date_mode: str, summary: bool = False) -> str:
+    """
+    Nome do statement de query_transactions para a combinação de filtros (date_mode: none | day | range).
+    summary=True: agregado (n, entradas, saídas) sobre todas as linhas do filtro, sem LIMIT.
+    """
+    return f"query_tx_{'sum_' if summary else ''}{int(text)}{int(type_filter)}_{date_mode}"
+
+
+def _query_transactions_sql(text: bool, type_filter: bool, date_mode: str, summary: bool = False) -> str:
+    # Parâmetros, na ordem: user_id, [texto], [type_id], [data | de, até], limit (só na listagem)
+    where = ["t.user_id = $1::text"]
+    n = 1
+    if text:
+        n += 1
+        where.append(f"(t.source_text ILIKE ${n}::text OR t.description ILIKE ${n}::text)")
+    if type_filter:
+        n += 1
+        where.append(f"t.type = ${n}::int")
+    order = "ORDER BY t.occurred_at DESC"
+    if date_mode == "day":
+        n += 1
+        where.append(local_date_range_sql("t.occurred_at", f"${n}", f"${n}"))
+        order = ""
+    elif date_mode == "range":
+        where.append(local_date_range_sql("t.occurred_at", f"${n + 1}", f"${n + 2}"))
+        n += 2
+        order = "ORDER BY t.occurred_at ASC"
+    if summary:
+        return f"""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(t.amount) FILTER (WHERE tt.type = 'INCOME'), 0),
+            COALESCE(SUM(t.amount) FILTER (WHERE tt.type = 'EXPENSES'), 0)
+        FROM
+            transactions t
+        JOIN
+            transaction_types tt ON t.type = tt.id
+        WHERE {' AND '.join(where)}
+    """
+    n += 1
+    return f"""
+        SELECT
+            t.id, t.amount, tt.type as type_name, c.name as category_name, t.description, t.payment_method, t.occurred_at, t.source_text
+        FROM
+            transactions t
+        JOIN
+            transaction_types tt ON t.type = tt.id
+        LEFT JOIN
+            categories c ON t.category_id = c.id
+        WHERE {' AND '.join(where)}
+        {order}
+        LIMIT ${n}::int
+    """
+
+
+# Conjunto fixo de formatos de SQL usados pelas tools (parâmetros em $n).
+STATEMENTS = {
+    "set_user": "SELECT set_config('app.user_id', $1::text, false)",
+    "resolve_type": "SELECT id FROM transaction_types WHERE UPPER(type) = $1::text LIMIT 1",
+    "resolve_category": "SELECT id FROM categories WHERE UPPER(name) = UPPER($1::text) LIMIT 1",
+    "insert_transaction": """
+        INSERT INTO transactions
+            (user_id, amount, "type", category_id, description, payment_method, occurred_at, source_text)
+        VALUES
+            ($1::text, $2::numeric, $3::int, $4::int, $5::text, $6::text, COALESCE($7::timestamptz, NOW()), $8::text)
+        RETURNING id, occurred_at
+    """,
+    # Ids para o INSERT em lote (serial ou identity: pg_get_serial_sequence serve aos dois)
+    "reserve_ids": "SELECT nextval(pg_get_serial_sequence('transactions', 'id')) FROM generate_series(1, $1::int)",
+    "total_balance": """
+        SELECT
+            SUM(CASE WHEN tt.type = 'INCOME' THEN t.amount ELSE -t.amount END)
+        FROM
+            transactions t
+        JOIN
+            transaction_types tt ON t.type = tt.id
+        WHERE
+            t.user_id = $1::text
+            AND tt.type IN ('INCOME', 'EXPENSES')
+    """,
+    "daily_balance": f"""
+        SELECT
+            SUM(CASE WHEN tt.type = 'INCOME' THEN t.amount ELSE -t.amount END)
+        FROM
+            transactions t
+        JOIN
+            transaction_types tt ON t.type = tt.id
+        WHERE
+            t.user_id = $1::text
+            AND tt.type IN ('INCOME', 'EXPENSES')
+            AND {local_date_range_sql("t.occurred_at", "$2", "$2")}
+    """,
+    "find_for_update": f"""
+        SELECT t.id
+        FROM transactions t
+        WHERE t.user_id = $1::text
+          AND (t.source_text ILIKE $2::text OR t.description ILIKE $2::text)
+          AND {local_date_range_sql("t.occurred_at", "$3", "$3")}
+        ORDER BY t.occurred_at DESC
+        LIMIT 1
+    """,
+    # Campos NULL mantêm o valor atual; o registro atualizado volta já com tipo/categoria
+    # resolvidos, sem SELECT separado.
+    "update_by_id": """
+        WITH u AS (
+            UPDATE transactions SET
+                amount = COALESCE($3::numeric, amount),
+                "type" = COALESCE($4::int, "type"),
+                category_id = COALESCE($5::int, category_id),
+                description = COALESCE($6::text, description),
+                payment_method = COALESCE($7::text, payment_method),
+                occurred_at = COALESCE($8::timestamptz, occurred_at)
+            WHERE id = $1::bigint AND user_id = $2::text
+            RETURNING *
+        )
+        SELECT
+          u.id, u.occurred_at, u.amount, tt.type AS type_name,
+          c.name AS category_name, u.description, u.payment_method, u.source_text
+        FROM u
+        JOIN transaction_types tt ON tt.id = u.type
+        LEFT JOIN categories c ON c.id = u.category_id
+    """,
+}
+
+for _text, _type, _date, _summary in product((False, True), (False, True), ("none", "day", "range"), (False, True)):
+    STATEMENTS[query_transactions_name(_text, _type, _date, _summary)] = _query_transactions_sql(_text, _type, _date, _summary)
+
+
+def _as_pyformat(sql: str) -> str:
+    return re.sub(r"\$(\d+)", r"%(p\1)s", sql)
+
+
+def execute(cur, name: str, params: Sequence = (), prepared: bool = None) -> None:
+    """
+    Executa o statement `name` de STATEMENTS com `params` (na ordem de $1..$n).
+    Com prepared statements, o PREPARE é feito uma vez por conexão do pool e as
+    chamadas seguintes só enviam EXECUTE (sem parse/plan de novo no servidor).
+    """
+    if prepared is None:
+        prepared = USE_PREPARED
+    known = getattr(cur.connection, "prepared", None)
+    if not prepared or known is None:
+        cur.execute(_as_pyformat(STATEMENTS[name]), {f"p{i}": v for i, v in enumerate(params, start=1)})
+        return
+    if name not in known:
+        cur.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        known.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", list(params))
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+if __name__ == "__main__":
+    # Latência por chamada: SQL comum (parse + plan a cada vez) vs. EXECUTE de statement preparado.
+    # Requer o banco configurado no .env.
+    import sys
+    import time
+    import pg_tools
+
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    user_id = os.getenv("DEFAULT_USER_ID") or "default"
+    cases = [
+        ("query_transactions (texto + intervalo)", query_transactions_name(True, False, "range"),
+         (user_id, "%mercado%", "2025-01-01", "2025-12-31", 20)),
+        ("query_transactions (recentes)", query_transactions_name(False, False, "none"), (user_id, 20)),
+        ("daily_balance", "daily_balance", (user_id, "2025-09-15")),
+        ("total_balance", "total_balance", (user_id,)),
+    ]
+    conn = pg_tools.get_conn()
+    try:
+        cur = conn.cursor()
+        for label, name, params in cases:
+            timings = {}
+            for prepared in (False, True):
+                execute(cur, name, params, prepared=prepared)  # aquecimento / PREPARE
+                cur.fetchall()
+                start = time.perf_counter()
+                for _ in range(calls):
+                    execute(cur, name, params, prepared=prepared)
+                    cur.fetchall()
+                timings[prepared] = (time.perf_counter() - start) / calls * 1000
+            saved = timings[False] - timings[True]
+            print(f"{label:40} simples {timings[False]:7.3f} ms  preparado {timings[True]:7.3f} ms  economia {saved:7.3f} ms")
+        conn.rollback()
+    finally:
+        pg_tools.release_conn(conn)
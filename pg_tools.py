@@ -1,9 +1,20 @@
 import os
+import time
+import threading
+from itertools import cycle
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from typing import Optional, List
 from langchain.tools import tool
 from pydantic import BaseModel, Field  
+from result_format import RESULT_FORMAT, compact_rows, compact_record, summary_totals
+from pg_write_queue import WriteBehindQueue
+import pg_queries
+from pg_queries import PreparedConnection, query_transactions_name
 
 
 load_dotenv()
@@ -52,6 +63,7 @@ class QueryTransactionsArgs(BaseModel):
     date_from_local: Optional[str] = Field(default=None, description="Data inicial para filtro (YYYY-MM-DD).")
     date_to_local: Optional[str] = Field(default=None, description="Data final para filtro (YYYY-MM-DD).")
     limit: int = Field(default=20, description="Número máximo de resultados (default = 20).")
+    summary: bool = Field(default=False, description="Inclui rodapé com contagem e totais (entradas, saídas, saldo) de todas as transações do filtro, não só das retornadas.")
 
 
 
@@ -61,20 +73,184 @@ TYPE_ALIASES = {
     "TRANSFER":"TRANSFER", "TRANSFERÊNCIA":"TRANSFER"
 }
 
-def get_conn():
-    return psycopg2.connect(
-    host = os.getenv("host"),
-    database =os.getenv("database"),    
-    user = os.getenv("user"),
-    password = os.getenv("password"),
-    port = os.getenv("port")
-)
+# Usuário dono da sessão atual; definido por quem chama as tools (ex.: fluxo_assessor),
+# nunca pelo LLM. Sem usuário definido, usa DEFAULT_USER_ID (implantação de um só usuário,
+# ex.: DEFAULT_USER_ID=default); se ele não estiver configurado, as tools falham em vez de
+# ler ou gravar dados de um usuário compartilhado.
+DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID") or None
+current_user_id: ContextVar[Optional[str]] = ContextVar("current_user_id", default=None)
+
+@contextmanager
+def user_scope(user_id: Optional[str]):
+    """Define o usuário das tools dentro do bloco: with user_scope("u123"): ..."""
+    token = current_user_id.set(user_id)
+    try:
+        yield
+    finally:
+        current_user_id.reset(token)
+
+def get_current_user_id() -> str:
+    user_id = current_user_id.get() or DEFAULT_USER_ID
+    if not user_id:
+        raise RuntimeError("Nenhum usuário na sessão: chame as tools dentro de user_scope(user_id) ou configure DEFAULT_USER_ID.")
+    return user_id
+
+def _apply_user_scope(cur) -> str:
+    """
+    Retorna o user_id da sessão e o publica em app.user_id, usado pelas
+    políticas de row-level security (migrations/optional_transactions_rls.sql).
+    """
+    user_id = get_current_user_id()
+    pg_queries.execute(cur, "set_user", (user_id,))
+    return user_id
+
+# Réplicas de leitura (opcional): DSNs separados por vírgula, ex.:
+# PG_REPLICA_DSNS="host=localhost port=5433 dbname=assessor user=app password=..."
+# Tools de leitura usam as réplicas em rodízio; escritas vão sempre ao primário.
+# Depois de uma escrita, o usuário lê do primário por PG_READ_YOUR_WRITES_S segundos.
+REPLICA_DSNS = [d.strip() for d in os.getenv("PG_REPLICA_DSNS", "").split(",") if d.strip()]
+READ_YOUR_WRITES_S = float(os.getenv("PG_READ_YOUR_WRITES_S", "5"))
+_replicas = cycle(REPLICA_DSNS) if REPLICA_DSNS else None
+_replicas_lock = threading.Lock()
+# Réplica que falhou fica fora do rodízio por PG_REPLICA_COOLDOWN_S (sem pagar o connect_timeout a cada volta)
+REPLICA_COOLDOWN_S = float(os.getenv("PG_REPLICA_COOLDOWN_S", "30"))
+_replica_down_until = {}  # dsn -> time.monotonic() até quando fica fora
+_last_write = {}  # user_id -> time.monotonic() da última escrita
+
+def _mark_write(user_id: Optional[str] = None) -> None:
+    now = time.monotonic()
+    with _replicas_lock:
+        _last_write[user_id or get_current_user_id()] = now
+        for uid in [u for u, t in _last_write.items() if now - t > READ_YOUR_WRITES_S]:
+            del _last_write[uid]
+
+def _wrote_recently() -> bool:
+    t = _last_write.get(get_current_user_id())
+    return t is not None and time.monotonic() - t <= READ_YOUR_WRITES_S
+
+def _next_replica() -> str:
+    with _replicas_lock:
+        return next(_replicas)
+
+def _mark_replica_down(dsn: str) -> None:
+    with _replicas_lock:
+        _replica_down_until[dsn] = time.monotonic() + REPLICA_COOLDOWN_S
+
+def _replica_available(dsn: str) -> bool:
+    return _replica_down_until.get(dsn, 0.0) <= time.monotonic()
+
+# Pool de conexões por destino (primário e cada réplica). As conexões são reutilizadas,
+# então os prepared statements de pg_queries valem por toda a vida da conexão.
+POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+_pools = {}  # chave -> (ThreadedConnectionPool, BoundedSemaphore)
+_pools_lock = threading.Lock()
+
+def _checkout(key: str, **connect_kwargs):
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = (
+                ThreadedConnectionPool(0, POOL_MAX, connection_factory=PreparedConnection, **connect_kwargs),
+                threading.BoundedSemaphore(POOL_MAX),
+            )
+        pool, slots = _pools[key]
+    # Espera uma conexão livre em vez de estourar PoolError quando o pool está cheio
+    slots.acquire()
+    try:
+        conn = pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+    conn.pool_key = key
+    return conn
+
+def release_conn(conn) -> None:
+    """Devolve a conexão ao pool (transação aberta é desfeita; conexão quebrada é descartada)."""
+    entry = _pools.get(getattr(conn, "pool_key", None))
+    if entry is None:
+        conn.close()
+        return
+    pool, slots = entry
+    try:
+        pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+def get_conn(readonly: bool = False):
+    """
+    Conexão do pool. readonly=True tenta uma réplica (rodízio, pulando as
+    indisponíveis e as que falharam há menos de PG_REPLICA_COOLDOWN_S), exceto logo
+    após uma escrita do mesmo usuário; sem réplica disponível, usa o primário.
+    Devolva com release_conn(conn).
+    """
+    if readonly and REPLICA_DSNS and not _wrote_recently():
+        for _ in range(len(REPLICA_DSNS)):
+            dsn = _next_replica()
+            if not _replica_available(dsn):
+                continue
+            conn = None
+            try:
+                conn = _checkout(dsn, dsn=dsn, connect_timeout=int(os.getenv("PG_REPLICA_CONNECT_TIMEOUT", "2")))
+                conn.set_session(readonly=True)
+                return conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                _mark_replica_down(dsn)
+                if conn is not None:
+                    release_conn(conn)
+                continue
+    return _primary_conn()
+
+def _primary_conn():
+    return _checkout(
+        "primary",
+        host = os.getenv("host"),
+        database =os.getenv("database"),
+        user = os.getenv("user"),
+        password = os.getenv("password"),
+        port = os.getenv("port")
+    )
+
+def _run_on(conn, work):
+    cur = None
+    try:
+        cur = conn.cursor()
+        return work(cur)
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        raise
+    finally:
+        try:
+            if cur is not None:
+                cur.close()
+            release_conn(conn)
+        except Exception:
+            pass
+
+def _run_readonly(work):
+    """
+    Executa work(cur) numa conexão de leitura (réplica quando possível). Uma conexão de
+    réplica morta só aparece na primeira consulta (set_session não fala com o servidor):
+    nesse caso a réplica entra em cooldown e a leitura é repetida uma vez no primário.
+    Outros erros (statement_timeout, cancelamento por conflito com a replicação) são
+    relançados: a réplica continua no rodízio e a consulta não é repetida.
+    """
+    conn = get_conn(readonly=True)
+    try:
+        return _run_on(conn, work)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        lost = isinstance(e, psycopg2.InterfaceError) or conn.closed != 0
+        if conn.pool_key == "primary" or not lost:
+            raise
+        _mark_replica_down(conn.pool_key)
+    return _run_on(_primary_conn(), work)
 
 def _get_category_id(cur, category_id: Optional[int], category_name: Optional[str]) -> Optional[int]:
     if category_id:
         return category_id
     if category_name:
-        cur.execute("SELECT id FROM categories WHERE UPPER(name)=UPPER(%s) LIMIT 1;", (category_name.strip(),))
+        pg_queries.execute(cur, "resolve_category", (category_name.strip(),))
         row = cur.fetchone()
         return row[0] if row else None
     return None
@@ -83,13 +259,30 @@ def _resolve_type_id(cur, type_id: Optional[int], type_name: Optional[str]) -> O
     if type_name:
         t = type_name.strip().upper()
         t = TYPE_ALIASES.get(t, t) 
-        cur.execute("SELECT id FROM transaction_types WHERE UPPER(type)=%s LIMIT 1;", (t,))
+        pg_queries.execute(cur, "resolve_type", (t,))
         row = cur.fetchone()
         return row[0] if row else None
     if type_id:
         return int(type_id)
     return 2 
 
+# Escrita com group commit (opcional): inserts concorrentes são agrupados em um
+# único INSERT multi-linha + commit a cada PG_WRITE_BATCH_WINDOW_MS ou PG_WRITE_BATCH_SIZE linhas.
+WRITE_BATCHING = os.getenv("PG_WRITE_BATCHING", "0") == "1"
+_write_queue = None
+
+INVALID_TYPE_MESSAGE = "Tipo inválido (use type_id ou type_name: INCOME/EXPENSES/TRANSFER)."
+
+def _add_transaction_queue() -> WriteBehindQueue:
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = WriteBehindQueue(
+            _insert_transactions_batch,
+            batch_size=int(os.getenv("PG_WRITE_BATCH_SIZE", "50")),
+            window_ms=float(os.getenv("PG_WRITE_BATCH_WINDOW_MS", "5")),
+        )
+    return _write_queue
+
 @tool("add_transaction", args_schema=AddTransactionArgs)
 def add_transaction(
     amount: float,
@@ -103,40 +296,77 @@ def add_transaction(
     payment_method: Optional[str] = None,
 ) -> dict:
     """Insere uma transação financeira no banco de dados Postgres."""
+    if not WRITE_BATCHING:
+        return _add_transaction_direct(
+            amount, source_text, occurred_at, type_id, type_name,
+            category_id, category_name, description, payment_method,
+        )
+    try:
+        row = _transaction_row(
+            amount, source_text, occurred_at, type_id, type_name,
+            category_id, category_name, description, payment_method,
+        )
+        return _add_transaction_queue().submit(row).result()
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+def _transaction_row(
+    amount: float,
+    source_text: str,
+    occurred_at: Optional[str] = None,
+    type_id: Optional[int] = None,
+    type_name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    category_name: Optional[str] = None,
+    description: Optional[str] = None,
+    payment_method: Optional[str] = None,
+) -> dict:
+    """Item da fila de escrita: os argumentos de add_transaction + o user_id da sessão."""
+    return {
+        "user_id": get_current_user_id(),
+        "amount": amount,
+        "source_text": source_text,
+        "occurred_at": occurred_at,
+        "type_id": type_id,
+        "type_name": type_name,
+        "category_id": category_id,
+        "category_name": category_name,
+        "description": description,
+        "payment_method": payment_method,
+    }
+
+def _add_transaction_direct(
+    amount: float,
+    source_text: str,
+    occurred_at: Optional[str] = None,
+    type_id: Optional[int] = None,
+    type_name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    category_name: Optional[str] = None,
+    description: Optional[str] = None,
+    payment_method: Optional[str] = None,
+) -> dict:
+    """Insere uma transação com conexão e commit próprios."""
     conn = get_conn()
     cur = conn.cursor()
     try:
+        user_id = _apply_user_scope(cur)
         resolved_type_id = _resolve_type_id(cur, type_id, type_name)
         resolved_category_id = _get_category_id(cur, category_id, category_name)
 
         if not resolved_type_id:
-            return {"status": "error", "message": "Tipo inválido (use type_id ou type_name: INCOME/EXPENSES/TRANSFER)."}
+            return {"status": "error", "message": INVALID_TYPE_MESSAGE}
 
-        if occurred_at:
-            cur.execute(
-                """
-                INSERT INTO transactions
-                    (amount, "type", category_id, description, payment_method, occurred_at, source_text)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s::timestamptz, %s)
-                RETURNING id, occurred_at;
-                """,
-                (amount, resolved_type_id, resolved_category_id, description, payment_method, occurred_at, source_text),
-            )
-        else:
-            cur.execute(
-                """
-                INSERT INTO transactions
-                    (amount, "type", category_id, description, payment_method, occurred_at, source_text)
-                VALUES
-                    (%s, %s, %s, %s, %s, NOW(), %s)
-                RETURNING id, occurred_at;
-                """,
-                (amount, resolved_type_id, resolved_category_id, description, payment_method, source_text),
-            )
+        # occurred_at ausente -> NOW() no banco
+        pg_queries.execute(
+            cur,
+            "insert_transaction",
+            (user_id, amount, resolved_type_id, resolved_category_id, description, payment_method, occurred_at or None, source_text),
+        )
 
         new_id, occurred = cur.fetchone()
         conn.commit()
+        _mark_write(user_id)
         return {"status": "ok", "id": new_id, "occurred_at": str(occurred)}
 
     except Exception as e:
@@ -145,18 +375,100 @@ def add_transaction(
     finally:
         try:
             cur.close()
-            conn.close()
+            release_conn(conn)
         except Exception:
             pass
 
+def _insert_transactions_batch(rows: List[dict]) -> List[dict]:
+    """
+    Insere um lote de transações (vindo de _write_queue) com um INSERT multi-linha
+    por usuário e um único commit. Retorna um resultado por linha, na mesma ordem,
+    no mesmo formato de _add_transaction_direct. Se o lote falhar no banco antes do
+    commit, cada linha é reprocessada isoladamente (depois de devolver a conexão do
+    lote) para que cada chamador receba o próprio erro. Se o próprio commit falhar,
+    não há como saber se o servidor gravou: as linhas não são repetidas e voltam com erro.
+    Erros que não são do banco sobem para a fila e falham todos os chamadores do lote.
+    """
+    results: List[Optional[dict]] = [None] * len(rows)
+    by_user = {}
+    committing = False
+    batch_failed = False
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        types, categories = {}, {}
+        for i, row in enumerate(rows):
+            type_key = (row["type_id"], row["type_name"])
+            if type_key not in types:
+                types[type_key] = _resolve_type_id(cur, *type_key)
+            category_key = (row["category_id"], row["category_name"])
+            if category_key not in categories:
+                categories[category_key] = _get_category_id(cur, *category_key)
+
+            if not types[type_key]:
+                results[i] = {"status": "error", "message": INVALID_TYPE_MESSAGE}
+                continue
+            by_user.setdefault(row["user_id"], []).append((i, (
+                row["user_id"], row["amount"], types[type_key], categories[category_key],
+                row["description"], row["payment_method"], row["occurred_at"], row["source_text"],
+            )))
+
+        for user_id, items in by_user.items():
+            pg_queries.execute(cur, "set_user", (user_id,))
+            # A ordem das linhas do RETURNING não é garantida: os ids são reservados antes
+            # e inseridos explicitamente, então cada chamador recebe o id da própria linha
+            pg_queries.execute(cur, "reserve_ids", (len(items),))
+            ids = [r[0] for r in cur.fetchall()]
+            returned = execute_values(
+                cur,
+                """
+                INSERT INTO transactions
+                    (id, user_id, amount, "type", category_id, description, payment_method, occurred_at, source_text)
+                OVERRIDING SYSTEM VALUE
+                VALUES %s
+                RETURNING id, occurred_at;
+                """,
+                [(new_id, *values) for new_id, (_, values) in zip(ids, items)],
+                template="(%s, %s, %s, %s, %s, %s, %s, COALESCE(%s::timestamptz, NOW()), %s)",
+                page_size=len(items),
+                fetch=True,
+            )
+            occurred_by_id = dict(returned)
+            for new_id, (i, _) in zip(ids, items):
+                results[i] = {"status": "ok", "id": new_id, "occurred_at": str(occurred_by_id[new_id])}
 
-class QueryTransactionsArgs(BaseModel):
-    text: Optional[str] = None
-    type_name: Optional[str] = None
-    date_local: Optional[str] = None
-    date_from_local: Optional[str] = None
-    date_to_local: Optional[str] = None
-    limit: int = 20
+        committing = True
+        conn.commit()
+
+    except psycopg2.Error as e:
+        if committing:
+            # O servidor pode ter gravado o lote antes da falha: repetir duplicaria as linhas
+            message = f"Falha ao confirmar o lote; a transação pode ter sido gravada: {e}"
+            return [r if r and r["status"] == "error" else {"status": "error", "message": message} for r in results]
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        batch_failed = True
+    finally:
+        try:
+            cur.close()
+            release_conn(conn)
+        except Exception:
+            pass
+
+    if batch_failed:
+        # Conexão do lote já devolvida: cada reprocessamento usa uma única vaga do pool
+        fallback = []
+        for row in rows:
+            fields = {k: v for k, v in row.items() if k != "user_id"}
+            with user_scope(row["user_id"]):
+                fallback.append(_add_transaction_direct(**fields))
+        return fallback
+
+    for user_id in by_user:
+        _mark_write(user_id)
+    return results
 
 
 @tool("query_transactions", args_schema=QueryTransactionsArgs)
@@ -167,6 +479,7 @@ def query_transactions(
     date_from_local: Optional[str] = None,
     date_to_local: Optional[str] = None,
     limit: int = 20,
+    summary: bool = False,
 ) -> dict:
     """
     Consulta transações com filtros por texto (source_text/description),
@@ -175,101 +488,85 @@ def query_transactions(
     Os dados devem vir na seguinte ordem:
     - Intervalo (date_from_local/date_to_local): ASC (cronológico).
     - Caso contrário: DESC (mais recentes primeiro).
+
+    Formato compacto: "cols" + "rows"; type_name/category_name são índices
+    para as listas em "dict". Com summary=True inclui em "summary" os totais de
+    TODAS as transações do filtro (não só das retornadas). "truncated": true indica
+    que há mais transações além de `limit`.
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        query = """
-            SELECT
-                t.id, t.amount, tt.type as type_name, c.name as category_name, t.description, t.payment_method, t.occurred_at, t.source_text
-            FROM
-                transactions t
-            JOIN
-                transaction_types tt ON t.type = tt.id
-            LEFT JOIN
-                categories c ON t.category_id = c.id
-            WHERE 1=1
-        """
-        params = []
+    def work(cur):
+        user_id = _apply_user_scope(cur)
+        # Um statement preparado por combinação de filtros (ver pg_queries.STATEMENTS)
+        params = [user_id]
 
         if text:
-            query += " AND (t.source_text ILIKE %s OR t.description ILIKE %s)"
-            params.extend([f"%{text}%", f"%{text}%"])
+            params.append(f"%{text}%")
         
         if type_name:
             resolved_type_id = _resolve_type_id(cur, None, type_name)
             if resolved_type_id:
-                query += " AND t.type = %s"
                 params.append(resolved_type_id)
             else:
                 return {"status": "error", "message": f"Tipo de transação '{type_name}' inválido."}
 
         if date_local:
-            query += " AND t.occurred_at::date = %s::date AT TIME ZONE 'America/Sao_Paulo'"
+            date_mode = "day"
             params.append(date_local)
         elif date_from_local and date_to_local:
-            query += " AND t.occurred_at::date BETWEEN %s::date AND %s::date AT TIME ZONE 'America/Sao_Paulo'"
+            date_mode = "range"
             params.extend([date_from_local, date_to_local])
-            query += " ORDER BY t.occurred_at ASC"
         else:
-            query += " ORDER BY t.occurred_at DESC"
+            date_mode = "none"
 
-        query += " LIMIT %s"
-        params.append(limit)
+        totals = None
+        if summary:
+            # Totais pelo agregado SQL sobre o mesmo filtro, sem LIMIT
+            pg_queries.execute(cur, query_transactions_name(bool(text), bool(type_name), date_mode, summary=True), params)
+            totals = summary_totals(*cur.fetchone())
 
-        cur.execute(query, params)
+        # Busca uma linha a mais só para saber se o resultado foi cortado
+        pg_queries.execute(cur, query_transactions_name(bool(text), bool(type_name), date_mode), params + [limit + 1])
         transactions = cur.fetchall()
+        truncated = len(transactions) > limit
+        transactions = transactions[:limit]
         
         col_names = [desc[0] for desc in cur.description]
-        
-        results = []
-        for row in transactions:
-            results.append(dict(zip(col_names, row)))
 
-        return {"status": "ok", "transactions": results}
+        if RESULT_FORMAT == "compact":
+            result = {"status": "ok", **compact_rows(col_names, transactions, summary=totals)}
+        else:
+            results = []
+            for row in transactions:
+                results.append(dict(zip(col_names, row)))
+            result = {"status": "ok", "transactions": results}
+            if totals:
+                result["summary"] = totals
+
+        if truncated:
+            result["truncated"] = True
+        return result
 
+    try:
+        return _run_readonly(work)
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": str(e)}
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
 
 @tool("total_balance")
 def total_balance() -> dict:
     """
-    Retorna o saldo total (INCOME - EXPENSES) em todo o histórico.
+    Retorna o saldo total (INCOME - EXPENSES) em todo o histórico do usuário.
     Ignora TRANSFER.
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        query = """
-            SELECT
-                SUM(CASE WHEN tt.type = 'INCOME' THEN t.amount ELSE -t.amount END)
-            FROM
-                transactions t
-            JOIN
-                transaction_types tt ON t.type = tt.id
-            WHERE
-                tt.type IN ('INCOME', 'EXPENSES');
-        """
-        cur.execute(query)
+    def work(cur):
+        user_id = _apply_user_scope(cur)
+        pg_queries.execute(cur, "total_balance", (user_id,))
         balance = cur.fetchone()[0]
         return {"status": "ok", "total_balance": float(balance) if balance is not None else 0.0}
 
+    try:
+        return _run_readonly(work)
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": str(e)}
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
 
 @tool("daily_balance")
 def daily_balance(date_local: str) -> dict:
@@ -277,33 +574,16 @@ def daily_balance(date_local: str) -> dict:
     Retorna o saldo (INCOME - EXPENSES) do dia local informado (YYYY-MM-DD)
     em America/Sao_Paulo. Ignora TRANSFER (type=3).
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        query = """
-            SELECT
-                SUM(CASE WHEN tt.type = 'INCOME' THEN t.amount ELSE -t.amount END)
-            FROM
-                transactions t
-            JOIN
-                transaction_types tt ON t.type = tt.id
-            WHERE
-                tt.type IN ('INCOME', 'EXPENSES')
-                AND t.occurred_at::date = %s::date AT TIME ZONE 'America/Sao_Paulo';
-        """
-        cur.execute(query, (date_local,))
+    def work(cur):
+        user_id = _apply_user_scope(cur)
+        pg_queries.execute(cur, "daily_balance", (user_id, date_local))
         balance = cur.fetchone()[0]
         return {"status": "ok", "daily_balance": float(balance) if balance is not None else 0.0}
 
+    try:
+        return _run_readonly(work)
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": str(e)}
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
 
 
 @tool("update_transaction", args_schema=UpdateTransactionArgs)
@@ -334,6 +614,7 @@ def update_transaction(
     conn = get_conn()
     cur = conn.cursor()
     try:
+        user_id = _apply_user_scope(cur)
         # Resolve target_id
         target_id = id
         if target_id is None:
@@ -341,17 +622,7 @@ def update_transaction(
                 return {"status": "error", "message": "Sem 'id': informe match_text E date_local para localizar o registro."}
 
             # Buscar o mais recente no dia local informado que combine o texto
-            cur.execute(
-                f"""
-                SELECT t.id
-                FROM transactions t
-                WHERE (t.source_text ILIKE %s OR t.description ILIKE %s)
-                  AND {_local_date_filter_sql("t.occurred_at")}
-                ORDER BY t.occurred_at DESC
-                LIMIT 1;
-                """,
-                (f"%{match_text}%", f"%{match_text}%", date_local)
-            )
+            pg_queries.execute(cur, "find_for_update", (user_id, f"%{match_text}%", date_local))
             row = cur.fetchone()
             if not row:
                 return {"status": "error", "message": "Nenhuma transação encontrada para os filtros fornecidos."}
@@ -361,56 +632,20 @@ def update_transaction(
         resolved_type_id = _resolve_type_id(cur, type_id, type_name) if (type_id or type_name) else None
         resolved_category_id = category_id
         if category_name and not category_id:
-            resolved_category_id = _get_category_id(cur, category_name)
-
-        # Montar SET dinâmico
-        sets = []
-        params: List[object] = []
-        if amount is not None:
-            sets.append("amount = %s")
-            params.append(amount)
-        if resolved_type_id is not None:
-            sets.append("type = %s")
-            params.append(resolved_type_id)
-        if resolved_category_id is not None:
-            sets.append("category_id = %s")
-            params.append(resolved_category_id)
-        if description is not None:
-            sets.append("description = %s")
-            params.append(description)
-        if payment_method is not None:
-            sets.append("payment_method = %s")
-            params.append(payment_method)
-        if occurred_at is not None:
-            sets.append("occurred_at = %s::timestamptz")
-            params.append(occurred_at)
-
-        if not sets:
-            return {"status": "error", "message": "Nenhum campo válido para atualizar."}
+            resolved_category_id = _get_category_id(cur, None, category_name)
 
-        params.append(target_id)
+        # Campos None mantêm o valor atual (COALESCE no statement update_by_id)
+        values = [amount, resolved_type_id, resolved_category_id, description, payment_method, occurred_at]
+        if all(v is None for v in values):
+            return {"status": "error", "message": "Nenhum campo válido para atualizar."}
 
-        cur.execute(
-            f"UPDATE transactions SET {', '.join(sets)} WHERE id = %s;",
-            params
-        )
+        # UPDATE ... RETURNING já traz o registro atualizado com tipo/categoria
+        pg_queries.execute(cur, "update_by_id", [target_id, user_id, *values])
+        r = cur.fetchone()
         rows_affected = cur.rowcount
         conn.commit()
+        _mark_write(user_id)
 
-        # Retornar o registro atualizado
-        cur.execute(
-            """
-            SELECT
-              t.id, t.occurred_at, t.amount, tt.type AS type_name,
-              c.name AS category_name, t.description, t.payment_method, t.source_text
-            FROM transactions t
-            JOIN transaction_types tt ON tt.id = t.type
-            LEFT JOIN categories c ON c.id = t.category_id
-            WHERE t.id = %s;
-            """,
-            (target_id,)
-        )
-        r = cur.fetchone()
         updated = None
         if r:
             updated = {
@@ -423,6 +658,11 @@ def update_transaction(
                 "payment_method": r[6],
                 "source_text": r[7],
             }
+            if RESULT_FORMAT == "compact":
+                # id já vai no topo; data sem microssegundos no fuso local
+                updated.pop("id")
+                updated["occurred_at"] = r[1]
+                updated = compact_record(updated)
 
         return {
             "status": "ok",
@@ -437,15 +677,8 @@ def update_transaction(
     finally:
         try:
             cur.close()
-            conn.close()
+            release_conn(conn)
         except Exception:
             pass
-    
-def _local_date_filter_sql(field: str = "occurred_at") -> str:
-    """
-    Retorna um trecho SQL para filtragem por dia local em America/Sao_Paulo.
-    Ex.: (occurred_at AT TIME ZONE 'America/Sao_Paulo')::date = %s::date
-    """
-    return f"(({field} AT TIME ZONE 'America/Sao_Paulo')::date = %s::date)"
 
-TOOLS = [add_transaction, query_transactions, total_balance, daily_balance, update_transaction, _local_date_filter_sql]
+TOOLS = [add_transaction, query_transactions, total_balance, daily_balance, update_transaction]
@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+from zoneinfo import ZoneInfo
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from result_format import estimate_tokens
+
+
+TZ = ZoneInfo("America/Sao_Paulo")
+
+
+def _message_text(message: BaseMessage) -> str:
+    text = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += json.dumps([{"name": c["name"], "args": c["args"]} for c in tool_calls], ensure_ascii=False, default=str)
+    return text
+
+
+def messages_tokens(messages: List[BaseMessage]) -> int:
+    return estimate_tokens("\n".join(_message_text(m) for m in messages)) if messages else 0
+
+
+class StaticPrefix:
+    """
+    Parte fixa de um prompt (system, alerta e few-shots) renderizada uma única vez por dia
+    local — o único valor variável dela é {today_local}. O prompt do chain recebe as
+    mensagens prontas num MessagesPlaceholder e só formata histórico e entrada a cada chamada.
+    """
+
+    def __init__(self, name: str, *messages):
+        self.name = name
+        self.template = ChatPromptTemplate.from_messages(list(messages))
+        self._rendered = (None, [], 0)  # (dia, mensagens, tokens)
+
+    def _render(self):
+        day = datetime.now(TZ).date().isoformat()
+        if self._rendered[0] != day:
+            kwargs = {"today_local": day} if "today_local" in self.template.input_variables else {}
+            messages = self.template.format_messages(**kwargs)
+            self._rendered = (day, messages, messages_tokens(messages))
+        return self._rendered
+
+    def messages(self) -> List[BaseMessage]:
+        return self._render()[1]
+
+    def tokens(self) -> int:
+        return self._render()[2]
+
+
+class PromptSizeReport(BaseCallbackHandler):
+    """
+    Tamanho (tokens estimados) de cada prompt enviado ao modelo, por chain. O chain é
+    identificado pelo metadata "prompt" (ver with_config nos chains do main.py); quando há
+    um StaticPrefix registrado com o mesmo nome, separa a parte fixa da variável.
+    """
+
+    def __init__(self):
+        self.prefixes: Dict[str, StaticPrefix] = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"calls": 0, "tokens": 0, "max_tokens": 0, "last_tokens": 0})
+
+    def register(self, *prefixes: StaticPrefix) -> None:
+        for prefix in prefixes:
+            self.prefixes[prefix.name] = prefix
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = (metadata or {}).get("prompt")
+        if not name:
+            return
+        for batch in messages:
+            tokens = messages_tokens(batch)
+            with self._lock:
+                stats = self._stats[name]
+                stats["calls"] += 1
+                stats["tokens"] += tokens
+                stats["max_tokens"] = max(stats["max_tokens"], tokens)
+                stats["last_tokens"] = tokens
+
+    def report(self) -> dict:
+        """Por chain: chamadas, média/máximo/último de tokens por chamada e tokens da parte fixa."""
+        with self._lock:
+            snapshot = {name: dict(s) for name, s in self._stats.items()}
+        report = {}
+        for name, s in snapshot.items():
+            prefix = self.prefixes.get(name)
+            report[name] = {
+                "calls": s["calls"],
+                "avg_tokens": round(s["tokens"] / s["calls"]) if s["calls"] else 0,
+                "max_tokens": s["max_tokens"],
+                "last_tokens": s["last_tokens"],
+                "static_tokens": prefix.tokens() if prefix else None,
+            }
+        return report
+
+
+prompt_sizes = PromptSizeReport()
@@ -0,0 +1,144 @@
+import os
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+
+TZ = ZoneInfo("America/Sao_Paulo")
+
+# "compact" (padrão) ou "full" (formato antigo, uma dict por linha)
+RESULT_FORMAT = os.getenv("TOOL_RESULT_FORMAT", "compact").strip().lower()
+TEXT_MAX_CHARS = int(os.getenv("TOOL_TEXT_MAX_CHARS", "60"))
+
+DICT_COLUMNS = ("type_name", "category_name")
+TEXT_COLUMNS = ("source_text", "description")
+
+
+def compact_value(value, max_chars: Optional[int] = None):
+    """Converte valores do banco em tipos JSON curtos (datas ISO sem micros, Decimal -> número)."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(TZ)
+        return value.replace(microsecond=0).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, str) and max_chars and len(value) > max_chars:
+        return value[: max_chars - 1].rstrip() + "…"
+    return value
+
+
+def summary_totals(n: int, income, expenses) -> dict:
+    """Rodapé de totais (n, entradas, saídas, líquido), ex.: a partir de um agregado SQL."""
+    income, expenses = float(income or 0), float(expenses or 0)
+    return {"n": n, "income": round(income, 2), "expenses": round(expenses, 2), "net": round(income - expenses, 2)}
+
+
+def compact_rows(
+    col_names: Sequence[str],
+    rows: Iterable[Sequence],
+    summary: Optional[dict] = None,
+    text_max_chars: int = TEXT_MAX_CHARS,
+) -> dict:
+    """
+    Codifica linhas no formato cabeçalho + linhas:
+      {"cols": [...], "rows": [[...], ...], "dict": {"type_name": [...], ...}, "summary": {...}}
+    Colunas em DICT_COLUMNS viram índices para a lista em "dict";
+    textos livres (TEXT_COLUMNS) são truncados. summary (ver summary_totals) vai como
+    está: os totais vêm do filtro inteiro, não das linhas recebidas (cortadas por LIMIT).
+    """
+    cols = list(col_names)
+    dictionaries = {c: [] for c in cols if c in DICT_COLUMNS}
+    positions = {c: {} for c in dictionaries}
+    text_idx = {i for i, c in enumerate(cols) if c in TEXT_COLUMNS}
+
+    out_rows: List[list] = []
+    for row in rows:
+        out = []
+        for i, (col, value) in enumerate(zip(cols, row)):
+            if col in dictionaries and value is not None:
+                pos = positions[col].get(value)
+                if pos is None:
+                    pos = positions[col][value] = len(dictionaries[col])
+                    dictionaries[col].append(value)
+                out.append(pos)
+            else:
+                out.append(compact_value(value, text_max_chars if i in text_idx else None))
+        out_rows.append(out)
+
+    result = {"cols": cols, "rows": out_rows}
+    if dictionaries:
+        result["dict"] = dictionaries
+    if summary:
+        result["summary"] = summary
+    return result
+
+
+def compact_record(record: dict, text_max_chars: int = TEXT_MAX_CHARS) -> dict:
+    """Versão curta de um único registro (ex.: retorno de update_transaction)."""
+    return {
+        k: compact_value(v, text_max_chars if k in TEXT_COLUMNS else None)
+        for k, v in record.items()
+        if v is not None
+    }
+
+
+def estimate_tokens(payload) -> int:
+    """Estimativa de tokens do texto que vai para o scratchpad (tiktoken se disponível; senão ~4 chars/token)."""
+    text = payload if isinstance(payload, str) else _as_tool_text(payload)
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        return max(1, len(text) // 4)
+
+
+def _as_tool_text(payload) -> str:
+    # Mesmo critério do langchain_core ao serializar o retorno da tool: JSON se possível, senão str().
+    try:
+        return json.dumps(payload, ensure_ascii=False)
+    except TypeError:
+        return str(payload)
+
+
+if __name__ == "__main__":
+    # Medição em conjuntos sintéticos parecidos com o retorno de query_transactions
+    import random
+    from datetime import timedelta, timezone
+
+    random.seed(7)
+    cols = ["id", "amount", "type_name", "category_name", "description", "payment_method", "occurred_at", "source_text"]
+    categorias = ["Alimentação", "Transporte", "Moradia", "Saúde", "Lazer", "Salário"]
+    textos = [
+        "gastei {v} reais no almoço com o pessoal do trabalho hoje no débito",
+        "paguei {v} de uber pra voltar pra casa depois da reunião",
+        "recebi {v} do salário do mês, caiu agora na conta",
+        "comprei remédio na farmácia, deu {v} no cartão de crédito",
+    ]
+    base = datetime(2025, 9, 1, 12, 0, tzinfo=timezone.utc)
+
+    def fake_rows(n):
+        rows = []
+        for i in range(n):
+            v = Decimal(f"{random.uniform(5, 900):.2f}")
+            t = random.choice(["EXPENSES"] * 4 + ["INCOME"])
+            rows.append((
+                1000 + i, v, t, random.choice(categorias), None if i % 3 else "almoço",
+                random.choice(["débito", "crédito", "pix"]),
+                base + timedelta(hours=7 * i, microseconds=123456),
+                random.choice(textos).format(v=v),
+            ))
+        return rows
+
+    print(f"{'linhas':>6} {'antes':>8} {'depois':>8} {'redução':>8}")
+    for n in (5, 20, 100):
+        rows = fake_rows(n)
+        before = {"status": "ok", "transactions": [dict(zip(cols, r)) for r in rows]}
+        income = sum(float(r[1]) for r in rows if r[2] == "INCOME")
+        expenses = sum(float(r[1]) for r in rows if r[2] == "EXPENSES")
+        after = {"status": "ok", **compact_rows(cols, rows, summary=summary_totals(n, income, expenses))}
+        b, a = estimate_tokens(before), estimate_tokens(after)
+        print(f"{n:>6} {b:>8} {a:>8} {1 - a / b:>8.0%}")
@@ -0,0 +1,214 @@
+import re
+import json
+import threading
+import unicodedata
+from typing import Literal, Optional
+
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel, Field, ValidationError
+
+
+ROUTES = ("financeiro", "agenda", "faq")
+
+# Variações que o modelo costuma produzir no lugar do nome exato da rota
+_ROUTE_PREFIXES = {
+    "financ": "financeiro", "transac": "financeiro", "gasto": "financeiro", "orcament": "financeiro",
+    "agenda": "agenda", "compromiss": "agenda", "calendar": "agenda", "evento": "agenda",
+    "faq": "faq", "duvida": "faq", "ajuda": "faq",
+}
+_DIRECT = ("responder", "resposta", "direto", "direta", "chat", "fora_escopo", "nenhuma", "none")
+
+_FIELD_RE = re.compile(
+    r"^[\s>*`-]*(ROUTE|ROTA|PERGUNTA_ORIGINAL|CLARIFY)\**\s*[:=]\s*(.*?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_PROTOCOL_RE = re.compile(r"^[\s>*`-]*(ROUTE|ROTA|PERGUNTA_ORIGINAL)\**\s*[:=]", re.IGNORECASE | re.MULTILINE)
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_JSON_PAIR_RE = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+FALLBACK_REPLY = "Não entendi bem. Sua dúvida é sobre finanças ou agenda/compromissos?"
+
+
+class RouteDecision(BaseModel):
+    """Decisão do roteador: encaminhar a mensagem a um especialista ou responder direto ao usuário."""
+
+    route: Literal["financeiro", "agenda", "faq", "responder"] = Field(
+        ...,
+        description="financeiro | agenda | faq para encaminhar ao especialista; responder para saudação, fora de escopo ou clarificação.",
+    )
+    pergunta_original: str = Field(default="", description="Mensagem completa do usuário, sem edições (quando encaminhar).")
+    clarify: str = Field(default="", description="Pergunta mínima se faltar um dado essencial; senão vazio.")
+    resposta: str = Field(default="", description="Resposta curta ao usuário quando route=responder.")
+
+    @property
+    def encaminhar(self) -> bool:
+        return self.route in ROUTES
+
+    def protocolo(self) -> str:
+        """Mensagem para o especialista, no protocolo textual que os prompts deles esperam."""
+        return f"ROUTE={self.route}\nPERGUNTA_ORIGINAL={self.pergunta_original}\nCLARIFY={self.clarify}"
+
+    def texto(self) -> str:
+        """O que fica no histórico da sessão: o protocolo (encaminhamento) ou a resposta direta."""
+        return self.protocolo() if self.encaminhar else self.resposta
+
+
+def normalize_route(value) -> Optional[str]:
+    """Nome da rota a partir do que o modelo escreveu (maiúsculas, acentos, <>, aspas, sinônimos)."""
+    if not isinstance(value, str):
+        return None
+    v = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode().lower()
+    v = v.strip().strip("<>\"'`*.,;:| ")
+    # Modelo repetiu o molde (ex.: "<financeiro|agenda|faq>") ou citou mais de uma rota: ambíguo
+    if "|" in v or sum(route in v for route in ROUTES) > 1:
+        return None
+    v = v.split()[0] if v else ""
+    if v in ROUTES:
+        return v
+    if v in _DIRECT:
+        return "responder"
+    for prefix, route in _ROUTE_PREFIXES.items():
+        if v.startswith(prefix):
+            return route
+    return None
+
+
+def decision_from_args(args: dict, pergunta: str) -> Optional[RouteDecision]:
+    """RouteDecision a partir de um dict (argumentos da tool ou JSON), corrigindo a rota se preciso."""
+    args = {str(k).lower(): v for k, v in args.items()}
+    route = normalize_route(args.get("route") or args.get("rota"))
+    if route is None:
+        return None
+    text = lambda key: args.get(key) if isinstance(args.get(key), str) else ""
+    decision = RouteDecision(
+        route=route,
+        pergunta_original=text("pergunta_original").strip() or pergunta.strip(),
+        clarify=text("clarify").strip(),
+        resposta=text("resposta").strip(),
+    )
+    if decision.route == "responder" and not decision.resposta:
+        return None
+    return decision
+
+
+def parse_route_text(text: str, pergunta: str) -> Optional[RouteDecision]:
+    """
+    Parser tolerante do protocolo textual (ROUTE=/PERGUNTA_ORIGINAL=/CLARIFY=): aceita cercas
+    de código, ':' no lugar de '=', marcadores de lista, chaves em minúsculas e JSON no conteúdo.
+    PERGUNTA_ORIGINAL ausente vira a própria mensagem do usuário. None se não há rota.
+    """
+    text = _FENCE_RE.sub("", (text or "").strip())
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return decision_from_args(data, pergunta)
+    fields = {}
+    for key, value in _FIELD_RE.findall(text):
+        fields.setdefault(key.upper(), value)
+    route = normalize_route(fields.get("ROUTE") or fields.get("ROTA"))
+    if route is None or route == "responder":
+        return None
+    return RouteDecision(
+        route=route,
+        pergunta_original=fields.get("PERGUNTA_ORIGINAL") or pergunta.strip(),
+        clarify=fields.get("CLARIFY", ""),
+    )
+
+
+def _looks_like_protocol(text: str) -> bool:
+    # Só campos no início da linha, como em _FIELD_RE; "rota:" no meio de uma frase é resposta normal
+    return bool(_PROTOCOL_RE.search(text or ""))
+
+
+class RouteParser:
+    """
+    Converte a saída do roteador (tool call RouteDecision ou texto) numa RouteDecision, sempre
+    sem nova chamada ao modelo. Ordem: tool call válida -> tool call corrigida -> protocolo
+    textual -> resposta direta. stats() conta quantas decisões vieram por cada caminho e as
+    falhas de parse (saída com cara de encaminhamento que não pôde ser interpretada).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "decisions": 0, "structured": 0, "repaired": 0, "text": 0, "direct": 0, "parse_failures": 0,
+            "routes": {route: 0 for route in ROUTES + ("responder",)},
+        }
+
+    def _count(self, path: str, decision: RouteDecision) -> RouteDecision:
+        with self._lock:
+            self._stats["decisions"] += 1
+            self._stats[path] += 1
+            self._stats["routes"][decision.route] += 1
+        return decision
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "routes": dict(self._stats["routes"])}
+
+    def parse(self, message, pergunta: str) -> RouteDecision:
+        content = message.content if isinstance(message, BaseMessage) else message
+        content = content if isinstance(content, str) else ""
+
+        for call in getattr(message, "tool_calls", None) or []:
+            if call.get("name") != RouteDecision.__name__:
+                continue
+            args = call.get("args") or {}
+            try:
+                decision, path = RouteDecision(**args), "structured"
+            except (ValidationError, TypeError):
+                decision, path = decision_from_args(args, pergunta), "repaired"
+            if decision and not decision.encaminhar and not decision.resposta:
+                decision = None
+            if decision:
+                decision.pergunta_original = decision.pergunta_original.strip() or pergunta.strip()
+                return self._count(path, decision)
+        for call in getattr(message, "invalid_tool_calls", None) or []:
+            # JSON truncado/malformado: aproveita os pares "chave": "valor" que vieram inteiros
+            pairs = dict(_JSON_PAIR_RE.findall(call.get("args") or ""))
+            decision = decision_from_args(pairs, pergunta) if pairs else None
+            if decision:
+                return self._count("repaired", decision)
+
+        decision = parse_route_text(content, pergunta)
+        if decision:
+            return self._count("text", decision)
+
+        failed = _looks_like_protocol(content) or not content.strip() or bool(
+            getattr(message, "tool_calls", None) or getattr(message, "invalid_tool_calls", None)
+        )
+        decision = RouteDecision(route="responder", resposta=content.strip() if not failed else FALLBACK_REPLY)
+        if failed:
+            with self._lock:
+                self._stats["parse_failures"] += 1
+        return self._count("direct", decision)
+
+
+if __name__ == "__main__":
+    # Verificação rápida do parser com saídas típicas (e desvios) do roteador.
+    from langchain_core.messages import AIMessage
+
+    parser = RouteParser()
+    pergunta = "Quanto gastei ontem?"
+    casos = [
+        (AIMessage(content="ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei ontem?\nCLARIFY="), "financeiro"),
+        (AIMessage(content="```\nroute: Finanças\nPergunta_Original: Quanto gastei ontem?\n```"), "financeiro"),
+        (AIMessage(content='{"route": "faq", "pergunta_original": "posso excluir?"}'), "faq"),
+        (AIMessage(content="", tool_calls=[{"name": "RouteDecision", "args": {"route": "agenda"}, "id": "1"}]), "agenda"),
+        (AIMessage(content="", tool_calls=[{"name": "RouteDecision", "args": {"route": "Finanças"}, "id": "2"}]), "financeiro"),
+        # molde repetido sem preencher: falha de parse, nunca "financeiro"
+        (AIMessage(content="ROUTE=<financeiro|agenda|faq>\nPERGUNTA_ORIGINAL=Quanto gastei ontem?"), "responder"),
+        (AIMessage(content="ROUTE=financeiro ou agenda"), "responder"),
+        # "rota:" no meio do texto continua sendo resposta direta
+        (AIMessage(content="Olá! Me diga a rota: finanças ou agenda?"), "responder"),
+    ]
+    for mensagem, esperado in casos:
+        decisao = parser.parse(mensagem, pergunta)
+        assert decisao.route == esperado, (mensagem, decisao)
+    assert parser.parse(casos[-1][0], pergunta).resposta == casos[-1][0].content
+    stats = parser.stats()
+    assert stats["parse_failures"] == 2, stats
+    print(stats)
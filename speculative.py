@@ -0,0 +1,72 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class SpeculativeTask:
+    def __init__(self, name: str, future: Future, started: float):
+        self.name = name
+        self.future = future
+        self.started = started
+        self.finished: Optional[float] = None
+
+
+class SpeculativeRunner:
+    """
+    Executa trabalho barato em paralelo antes de saber se ele será necessário
+    (ex.: recuperação do FAQ enquanto o roteador decide a rota).
+
+    start() dispara as tarefas (no contexto atual, preservando contextvars como
+    o usuário da sessão); depois da decisão, cada tarefa é usada com take()
+    ou descartada com discard(). stats() compara o tempo economizado (trabalho
+    que rodou em paralelo ao roteador) com o trabalho desperdiçado.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._stats = {
+            "started": 0, "used": 0, "discarded": 0, "cancelled": 0, "failed": 0,
+            "saved_s": 0.0, "wasted_s": 0.0,
+        }
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def start(self, **tasks: Callable[[], object]) -> Dict[str, SpeculativeTask]:
+        started = {}
+        for name, fn in tasks.items():
+            ctx = contextvars.copy_context()
+            task = SpeculativeTask(name, self._executor.submit(ctx.run, fn), time.monotonic())
+            task.future.add_done_callback(lambda _f, t=task: setattr(t, "finished", time.monotonic()))
+            started[name] = task
+            self._count("started")
+        return started
+
+    def take(self, task: SpeculativeTask, decided_at: float, timeout: Optional[float] = None):
+        """Espera e devolve o resultado da tarefa; None se ela falhou (o chamador refaz o trabalho)."""
+        try:
+            result = task.future.result(timeout=timeout)
+        except (Exception, CancelledError):
+            self._count("failed")
+            return None
+        self._count("used")
+        self._count("saved_s", min(task.finished or decided_at, decided_at) - task.started)
+        return result
+
+    def discard(self, task: SpeculativeTask) -> None:
+        """Cancela a tarefa se ainda não começou; senão contabiliza o tempo gasto como desperdício."""
+        if task.future.cancel():
+            self._count("cancelled")
+            return
+        self._count("discarded")
+        task.future.add_done_callback(
+            lambda _f: self._count("wasted_s", (task.finished or time.monotonic()) - task.started)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)